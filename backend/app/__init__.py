@@ -1,8 +1,14 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
 from flask_migrate import Migrate
+from sqlalchemy import text
 from .models.user import db
+from .services import gemini_http
+from .services.admission import AdmissionController, classify
+from .services.rate_limiter import ChatRateLimiter
+from .services.llm_metrics import metrics
+from .services.gemini_service import get_gemini_service
 from config import config
 from datetime import datetime
 
@@ -51,10 +57,12 @@ def create_app(config_name='default'):
                  "Accept",
                  "Origin",
                  "Access-Control-Request-Method",
-                 "Access-Control-Request-Headers"
+                 "Access-Control-Request-Headers",
+                 "X-Deadline-Ms"
              ],
              "supports_credentials": True,
-             "expose_headers": ["Content-Range", "X-Content-Range"],
+             "expose_headers": ["Content-Range", "X-Content-Range", "X-RateLimit-Limit",
+                                "X-RateLimit-Remaining", "X-RateLimit-Reset", "Retry-After"],
              "max_age": 3600
          }},
          supports_credentials=True)
@@ -67,9 +75,9 @@ def create_app(config_name='default'):
             response.headers['Access-Control-Allow-Origin'] = origin
             response.headers['Access-Control-Allow-Credentials'] = 'true'
             response.headers['Access-Control-Allow-Methods'] = 'GET, POST, PUT, DELETE, OPTIONS'
-            response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization, X-Requested-With, Accept, Origin, Access-Control-Request-Method, Access-Control-Request-Headers'
+            response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization, X-Requested-With, Accept, Origin, Access-Control-Request-Method, Access-Control-Request-Headers, X-Deadline-Ms'
             response.headers['Access-Control-Max-Age'] = '3600'
-            response.headers['Access-Control-Expose-Headers'] = 'Content-Range, X-Content-Range'
+            response.headers['Access-Control-Expose-Headers'] = 'Content-Range, X-Content-Range, X-RateLimit-Limit, X-RateLimit-Remaining, X-RateLimit-Reset, Retry-After'
             # Additional security headers
             response.headers['X-Content-Type-Options'] = 'nosniff'
             response.headers['X-Frame-Options'] = 'DENY'
@@ -79,7 +87,7 @@ def create_app(config_name='default'):
     # Add security headers in production
     @app.after_request
     def add_security_headers(response):
-        if app.config['ENV'] == 'production':
+        if app.config_name == 'production':
             # Security headers
             response.headers['Strict-Transport-Security'] = 'max-age=31536000; includeSubDomains'
             response.headers['X-Content-Type-Options'] = 'nosniff'
@@ -99,12 +107,44 @@ def create_app(config_name='default'):
             if origin in allowed_origins:
                 response.headers['Access-Control-Allow-Origin'] = origin
                 response.headers['Access-Control-Allow-Methods'] = 'GET, POST, PUT, DELETE, OPTIONS'
-                response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization, X-Requested-With'
+                response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization, X-Requested-With, X-Deadline-Ms'
                 response.headers['Access-Control-Allow-Credentials'] = 'true'
                 response.headers['Access-Control-Max-Age'] = '3600'
             return response
         return None
     
+    # Admission control: shed chat (then browsing) load with a fast 503
+    # before it can tie up the workers that checkout and cart need
+    admission = AdmissionController(
+        {
+            'low': app.config['ADMISSION_LOW_MAX_IN_FLIGHT'],
+            'medium': app.config['ADMISSION_MEDIUM_MAX_IN_FLIGHT']
+        },
+        retry_after=app.config['ADMISSION_RETRY_AFTER'],
+        lock_dir=app.config['ADMISSION_LOCK_DIR']
+    )
+    app.extensions['admission'] = admission
+    app.extensions['chat_rate_limiter'] = ChatRateLimiter.from_config(app.config)
+    
+    @app.before_request
+    def admit_request():
+        g.admission = admission.try_admit(classify(request.blueprint))
+        if g.admission is None:
+            response = jsonify({
+                'error': 'The server is busy, please try again shortly',
+                'retry_after': admission.retry_after
+            })
+            response.status_code = 503
+            response.headers['Retry-After'] = str(admission.retry_after)
+            return response
+        return None
+    
+    @app.teardown_request
+    def release_admission(exc):
+        admitted = g.pop('admission', None)
+        if admitted is not None:
+            admission.release(admitted)
+    
     # Initialize JWT
     jwt = JWTManager(app)
     
@@ -163,10 +203,10 @@ def create_app(config_name='default'):
     
     # Health check route
     @app.route('/health')
-    def health_check():
+    def detailed_health_check():
         try:
             # Check database connection
-            db.session.execute('SELECT 1')
+            db.session.execute(text('SELECT 1'))
             db_status = 'healthy'
         except Exception as e:
             app.logger.error(f'Database health check failed: {str(e)}')
@@ -191,6 +231,23 @@ def create_app(config_name='default'):
                 'database': db_status,
                 'redis': redis_status
             },
+            'gemini': {
+                'api': get_gemini_service().status(),
+                'cache': get_gemini_service().cache.stats(),
+                'parse_memo': get_gemini_service().parse_memo.stats(),
+                'intent_tiers': get_gemini_service().intent_classifier.stats(),
+                'prompts': get_gemini_service().prompts.stats(),
+                'suggestion_bank': get_gemini_service().suggestion_bank.stats(),
+                'single_flight': get_gemini_service().single_flight.stats(),
+                'traffic': get_gemini_service().traffic.stats(),
+                'concurrency': get_gemini_service().limiter.stats(),
+                'hedging': get_gemini_service().hedging.stats(),
+                'speculative_searches': metrics.speculative_searches(),
+                'circuit_breaker': gemini_http.breaker.snapshot(),
+                'http_pool': gemini_http.pool_stats()
+            },
+            'admission': admission.stats(),
+            'chat_rate_limit': app.extensions['chat_rate_limiter'].stats() if app.extensions['chat_rate_limiter'] else None,
             'version': '1.0.0',
             'environment': app.config.get('FLASK_ENV', 'production')
         }
@@ -201,6 +258,13 @@ def create_app(config_name='default'):
             
         return jsonify(response)
     
+    # LLM telemetry for this worker process
+    @app.route('/metrics')
+    def llm_metrics():
+        if request.args.get('format') == 'json':
+            return jsonify(metrics.snapshot())
+        return Response(metrics.render_prometheus(), mimetype='text/plain; version=0.0.4')
+    
     # Add database seeding for production
     if config_name == 'production':
         with app.app_context():
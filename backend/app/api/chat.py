@@ -1,18 +1,472 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, Response, current_app, request, jsonify, make_response, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from sqlalchemy import or_, and_
-from ..models.chat import ChatMessage
+from ..models.chat import ChatMessage, ChatSessionSummary
 from ..models.product import Product
 from ..models.user import db
-from ..services.gemini_service import GeminiService
+from werkzeug.local import LocalProxy
+from ..services import deadline
+from ..services.conversation_summary import fold_into_summary
+from ..services.gemini_service import get_gemini_service
+from ..services.llm_metrics import metrics
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from functools import wraps
+import json
 import uuid
+import threading
 
 chat_bp = Blueprint('chat', __name__)
-gemini_service = GeminiService()
+gemini_service = LocalProxy(get_gemini_service)
+
+NON_ELECTRONICS_KEYWORDS = [
+    'jeans', 'clothes', 'clothing', 'shoes', 'shirt', 'dress', 'pants', 
+    'jacket', 'furniture', 'food', 'books', 'medicine', 'grocery'
+]
+
+FALLBACK_MESSAGE = "Welcome to NexTechAI! 🚀 I'm Alex, your personal AI shopping assistant here to help you discover the perfect technology solutions from our premium electronics collection. What cutting-edge tech can I help you find today? We specialize in laptops, smartphones, gaming gear, audio equipment, and much more!"
+
+def _search_products(user_message, filters):
+    """Run the catalog search for a chat query and its parsed filters."""
+    query = Product.query
+    
+    # Handle special cases for broader matching
+    user_query_lower = user_message.lower()
+    
+    # Special handling for headphones/headsets queries
+    if any(keyword in user_query_lower for keyword in ['headphone', 'headset', 'earbuds']):
+        # Search in both audio and gaming categories for headphone-related products
+        
+        # Get audio headphones/earbuds
+        audio_query = Product.query.filter(
+            Product.category == 'audio',
+            Product.subcategory.in_(['headphones', 'earbuds'])
+        )
+        
+        # Get gaming headsets
+        gaming_query = Product.query.filter(
+            Product.category == 'gaming',
+            Product.subcategory == 'headsets'
+        )
+        
+        # Apply price filter to both queries
+        if filters.get('price_range'):
+            if filters['price_range'].get('min'):
+                audio_query = audio_query.filter(Product.price >= filters['price_range']['min'])
+                gaming_query = gaming_query.filter(Product.price >= filters['price_range']['min'])
+            if filters['price_range'].get('max'):
+                audio_query = audio_query.filter(Product.price <= filters['price_range']['max'])
+                gaming_query = gaming_query.filter(Product.price <= filters['price_range']['max'])
+        
+        # Apply other filters
+        if filters.get('color'):
+            audio_query = audio_query.filter(Product.color == filters['color'])
+            gaming_query = gaming_query.filter(Product.color == filters['color'])
+        if filters.get('storage'):
+            audio_query = audio_query.filter(Product.size == filters['storage'])
+            gaming_query = gaming_query.filter(Product.size == filters['storage'])
+        
+        # Combine results
+        audio_products = audio_query.all()
+        gaming_products = gaming_query.all()
+        
+        # Merge and deduplicate
+        all_products = audio_products + gaming_products
+        seen_ids = set()
+        products = []
+        for p in all_products:
+            if p.id not in seen_ids:
+                products.append(p)
+                seen_ids.add(p.id)
+        # Sort by rating and stock
+        products.sort(key=lambda x: (-x.rating, -x.stock_quantity))
+        return products[:20]
+    
+    # Use OR logic for broader, more inclusive product matching
+    # This will show more products instead of being overly restrictive
+    
+    # Build OR conditions for broader category matching
+    category_conditions = []
+    
+    # Add the parsed category/subcategory
+    if filters.get('category'):
+        category_conditions.append(Product.category == filters['category'])
+    if filters.get('subcategory'):
+        category_conditions.append(Product.subcategory == filters['subcategory'])
+    # Special handling for phone queries - include all phone-related categories
+    if any(keyword in user_query_lower for keyword in ['phone', 'mobile', 'smartphone']):
+        category_conditions.extend([
+            Product.category == 'smartphones',
+            Product.subcategory == 'smartphones'
+        ])
+        
+        # For performance/flagship phones, include premium and gaming styles
+        if any(keyword in user_query_lower for keyword in ['performance', 'best', 'flagship', 'powerful', 'fast']):
+            category_conditions.extend([
+                Product.style == 'premium',
+                Product.style == 'gaming',
+                Product.subcategory == 'flagship'
+            ])
+    
+    # For casual/budget queries, show more product styles
+    if any(keyword in user_query_lower for keyword in ['casual', 'budget', 'cheap', 'affordable', 'low price']):
+        category_conditions.extend([
+            Product.style == 'budget',
+            Product.style == 'student',
+            Product.style == 'casual'
+        ])
+    
+    # Apply category conditions with OR logic (show if ANY condition matches)
+    if category_conditions:
+        query = query.filter(or_(*category_conditions))
+    
+    # Apply price filters (these are mandatory - use AND logic)
+    if filters.get('price_range'):
+        if filters['price_range'].get('min'):
+            query = query.filter(Product.price >= filters['price_range']['min'])
+        if filters['price_range'].get('max'):
+            query = query.filter(Product.price <= filters['price_range']['max'])
+    
+    # Execute query and get results
+    products = query.order_by(
+        Product.rating.desc(),
+        Product.stock_quantity.desc()
+    ).limit(20).all()
+    
+    # If no products found, fallback to broader search (remove category restrictions)
+    if not products:
+        fallback_query = Product.query
+        if filters.get('price_range'):
+            if filters['price_range'].get('min'):
+                fallback_query = fallback_query.filter(Product.price >= filters['price_range']['min'])
+            if filters['price_range'].get('max'):
+                fallback_query = fallback_query.filter(Product.price <= filters['price_range']['max'])
+        products = fallback_query.order_by(
+            Product.rating.desc(),
+            Product.stock_quantity.desc()
+        ).limit(10).all()
+    
+    return products
+
+def _release_db_connection():
+    """Hand the session's connection back to the pool before a slow LLM call.
+
+    Otherwise every in-flight chat turn pins a pooled connection while it
+    waits on Gemini, and the pool caps chat concurrency long before the
+    workers do.
+    """
+    db.session.close()
+
+def _find_products(user_message, filters):
+    """_search_products as dicts, with the DB connection released afterwards.
+
+    Returns no products once the turn's deadline has passed.
+    """
+    if deadline.current() is not None and deadline.current().expired():
+        deadline.degrade('search', 'deadline')
+        return []
+    product_list = [product.to_dict() for product in _search_products(user_message, filters)]
+    _release_db_connection()
+    return product_list
+
+def _search_signature(filters):
+    """The parts of the filters _search_products reads; filters with the same
+    signature return the same products for the same message."""
+    price_range = filters.get('price_range') or {}
+    return (filters.get('category'), filters.get('subcategory'),
+            price_range.get('min'), price_range.get('max'),
+            filters.get('color'), filters.get('storage'))
+
+def _parse_and_search(user_message):
+    """parse_query and the catalog search for its filters, as (filters, products).
+
+    The search starts right away with the keyword filters while Gemini
+    parses the message. When the parsed filters search the same way that
+    result is used and the search costs the turn nothing; otherwise the
+    catalog is searched again with the parsed filters. A parse that is not
+    back by the turn's deadline is abandoned for the keyword filters.
+    """
+    parse_cancel = threading.Event()
+    parse_future = gemini_service.submit(gemini_service.parse_query, user_message, cancel_event=parse_cancel)
+    keyword_filters = gemini_service.keyword_filters(user_message)
+    speculative = _find_products(user_message, keyword_filters) if keyword_filters else None
+    
+    try:
+        filters = parse_future.result(timeout=deadline.remaining(current_app.config['CHAT_DEADLINE_SECONDS']))
+    except FutureTimeoutError:
+        parse_cancel.set()
+        parse_future.cancel()
+        deadline.degrade('parse', 'timeout')
+        print("Query parsing timed out, using keyword filters")
+        filters = keyword_filters
+    except Exception as e:
+        print(f"Error parsing query: {str(e)}")
+        filters = keyword_filters
+    
+    if not filters:
+        return filters, []
+    if speculative is not None and _search_signature(filters) == _search_signature(keyword_filters):
+        metrics.record_speculative_search('hit')
+        return filters, speculative
+    if speculative is not None:
+        metrics.record_speculative_search('miss')
+    return filters, _find_products(user_message, filters)
+
+def _merge_products(primary, extra):
+    """Append products from extra that are not already in primary."""
+    seen_ids = {p['id'] for p in primary}
+    return primary + [p for p in extra if p['id'] not in seen_ids]
+
+def _save_user_message(user_id, session_id, message):
+    user_message = ChatMessage(
+        user_id=user_id,
+        message=message,
+        is_bot=False,
+        session_id=session_id,
+        message_metadata={}
+    )
+    db.session.add(user_message)
+    db.session.commit()
+    return user_message
+
+def _load_history(user_id, session_id):
+    """Last 10 messages of the session, oldest first, as dicts.
+
+    Messages already folded into the session summary are replaced by a
+    single summary entry at the front. Once the turn's deadline has passed
+    the turn goes ahead without history.
+    """
+    if deadline.current() is not None and deadline.current().expired():
+        deadline.degrade('history', 'deadline')
+        return []
+    
+    conversation_history = ChatMessage.query.filter_by(
+        user_id=user_id,
+        session_id=session_id
+    ).order_by(ChatMessage.created_at.desc()).limit(10).all()
+    
+    history_list = [msg.to_dict() for msg in reversed(conversation_history)]
+    
+    summary = ChatSessionSummary.query.filter_by(user_id=user_id, session_id=session_id).first()
+    if summary and summary.summary:
+        history_list = [msg for msg in history_list if msg['id'] > summary.summarized_until]
+        history_list.insert(0, summary.to_history_entry())
+    
+    _release_db_connection()
+    return history_list
+
+def _update_session_summary(user_id, session_id):
+    """Fold older messages into the rolling summary once raw history gets big.
+
+    Only messages newer than the summary are read, so each turn does a
+    bounded amount of work; the most recent CHAT_SUMMARY_KEEP_RECENT
+    messages always stay verbatim.
+    """
+    threshold = current_app.config['CHAT_SUMMARY_THRESHOLD']
+    keep_recent = current_app.config['CHAT_SUMMARY_KEEP_RECENT']
+    
+    summary = ChatSessionSummary.query.filter_by(user_id=user_id, session_id=session_id).first()
+    summarized_until = summary.summarized_until if summary else 0
+    pending = ChatMessage.query.filter(
+        ChatMessage.user_id == user_id,
+        ChatMessage.session_id == session_id,
+        ChatMessage.id > summarized_until
+    ).order_by(ChatMessage.id.asc()).all()
+    
+    if len(pending) <= keep_recent or sum(len(msg.message) for msg in pending) <= threshold:
+        return
+    
+    to_fold = pending[:-keep_recent] if keep_recent else pending
+    if summary is None:
+        summary = ChatSessionSummary(user_id=user_id, session_id=session_id)
+        db.session.add(summary)
+    summary.summary = fold_into_summary(
+        summary.summary,
+        [msg.to_dict() for msg in to_fold],
+        current_app.config['CHAT_SUMMARY_MAX_CHARS']
+    )
+    summary.summarized_until = to_fold[-1].id
+    summary.message_count += len(to_fold)
+    db.session.commit()
+
+def _save_bot_message(user_id, session_id, message, metadata):
+    bot_message = ChatMessage(
+        user_id=user_id,
+        message=message,
+        is_bot=True,
+        session_id=session_id,
+        message_metadata=metadata
+    )
+    db.session.add(bot_message)
+    db.session.commit()
+    
+    try:
+        _update_session_summary(user_id, session_id)
+    except Exception as e:
+        db.session.rollback()
+        print(f"Error updating session summary: {str(e)}")
+    return bot_message
+
+def _store_suggestions(message_id, suggestions, status):
+    bot_message = db.session.get(ChatMessage, message_id)
+    if bot_message is None:
+        return
+    # Assign a new dict; in-place changes to a JSON column are not tracked
+    metadata = dict(bot_message.message_metadata or {})
+    metadata['suggestions'] = suggestions
+    metadata['suggestions_status'] = status
+    bot_message.message_metadata = metadata
+    db.session.commit()
+
+def _generate_deferred_suggestions(app, message_id, query, products, conversation_type, filters):
+    with app.app_context():
+        try:
+            suggestions = gemini_service.generate_suggestions(query, products, conversation_type, filters)
+            _store_suggestions(message_id, suggestions, 'ready')
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error generating deferred suggestions: {str(e)}")
+            try:
+                _store_suggestions(message_id, gemini_service._fallback_suggestions(conversation_type, products, filters), 'fallback')
+            except Exception as e:
+                db.session.rollback()
+                print(f"Error storing fallback suggestions: {str(e)}")
+        finally:
+            db.session.remove()
+
+def _defer_suggestions(bot_message, query, products, conversation_type, filters):
+    """Generate LLM suggestions for a stored bot message after the reply is sent.
+
+    The message carries the static fallback suggestions until the
+    background worker writes the generated ones into its metadata; clients
+    fetch them from /suggestions/<message_id>.
+    """
+    gemini_service.background_executor.submit(
+        _generate_deferred_suggestions,
+        current_app._get_current_object(),
+        bot_message.id,
+        query,
+        list(products),
+        conversation_type,
+        filters
+    )
+
+def _turn_deadline():
+    """Deadline for the current chat turn.
+
+    CHAT_DEADLINE_SECONDS is the budget; clients can ask for a shorter one
+    with an X-Deadline-Ms header but never a longer one.
+    """
+    budget = current_app.config['CHAT_DEADLINE_SECONDS']
+    requested = request.headers.get('X-Deadline-Ms')
+    if requested:
+        try:
+            budget = min(budget, max(0.0, float(requested) / 1000))
+        except ValueError:
+            pass
+    return deadline.Deadline(budget)
+
+def _chat_response(payload):
+    """jsonify a chat reply, listing the stages that fell back to a
+    second-best answer (and why) under ``degraded``."""
+    current = deadline.current()
+    payload['degraded'] = current.degraded() if current is not None else {}
+    return jsonify(payload)
+
+def rate_limited(view):
+    """Apply the chat rate limits to a JWT-protected view.
+
+    Requests over either the user's or the global budget get a 429; every
+    response carries X-RateLimit-Limit/Remaining/Reset for the user's bucket.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        limiter = current_app.extensions.get('chat_rate_limiter')
+        if limiter is None:
+            return view(*args, **kwargs)
+        limit = limiter.check(str(get_jwt_identity()))
+        if not limit.allowed:
+            response = jsonify({
+                'error': 'Too many messages, please slow down',
+                'retry_after': round(limit.retry_after, 1)
+            })
+            response.status_code = 429
+        else:
+            response = make_response(view(*args, **kwargs))
+        response.headers.update(limit.headers())
+        return response
+    return wrapper
+
+def _fused_turn(user_id, session_id, user_message, history_list):
+    """Answer a turn with one Gemini call (GEMINI_PIPELINE_MODE=fused).
+
+    Greetings and thank-yous the local classifier is sure of are answered
+    without the call. Otherwise candidate products come
+    from a keyword search so the single call can write its reply against
+    real inventory. Messages without keyword filters, and greetings, get
+    no candidates: an unfiltered search would only hand the model the
+    catalog's top sellers to talk about.
+    """
+    keyword_filters = gemini_service.keyword_filters(user_message)
+    candidates = []
+    turn = gemini_service.local_turn(user_message, history_list)
+    if turn is None:
+        local_analysis, _ = gemini_service.intent_classifier.classify(user_message, history_list)
+        if keyword_filters and local_analysis.get('intent') != 'greeting':
+            candidates = _find_products(user_message, keyword_filters)
+        turn = gemini_service.process_turn(user_message, candidates, history_list)
+    conversation_analysis = turn['analysis']
+    filters = turn['filters']
+    response_msg = turn['reply']
+    product_list = []
+    
+    if conversation_analysis.get('intent') == 'greeting':
+        conversation_type = 'greeting'
+        suggestions = turn['suggestions'] or gemini_service._fallback_suggestions(conversation_type, [])
+    elif conversation_analysis.get('needs_products', True) and filters:
+        conversation_type = 'product_recommendation'
+        product_list = candidates
+        if not candidates or _search_signature(filters) != _search_signature(keyword_filters):
+            # The model's filters are the better read of the request, so
+            # their matches lead; candidates the reply may mention follow
+            llm_products = _find_products(user_message, filters)
+            product_list = _merge_products(llm_products, candidates)
+        suggestions = turn['suggestions'] or gemini_service._fallback_suggestions(conversation_type, product_list, filters)
+    elif conversation_analysis.get('needs_products', True):
+        conversation_type = 'clarification'
+        suggestions = turn['suggestions'] or gemini_service._fallback_suggestions(conversation_type, [])
+    else:
+        conversation_type = 'general_help'
+        suggestions = turn['suggestions'] or gemini_service._fallback_suggestions(conversation_type, [])
+    
+    metadata = {
+        'conversation_analysis': conversation_analysis,
+        'suggestions': suggestions,
+        'pipeline': 'fused'
+    }
+    if conversation_type == 'product_recommendation':
+        metadata['filters'] = filters
+        metadata['product_count'] = len(product_list)
+    _save_bot_message(user_id, session_id, response_msg, metadata)
+    
+    response = {
+        'message': response_msg,
+        'session_id': session_id,
+        'products': product_list[:8],
+        'conversation_type': conversation_type,
+        'suggestions': suggestions
+    }
+    if conversation_type == 'product_recommendation':
+        response['total_found'] = len(product_list)
+    return _chat_response(response)
 
 @chat_bp.route('/message', methods=['POST'])
 @jwt_required()
+@rate_limited
 def send_message():
+    with deadline.activate(_turn_deadline()):
+        return _send_message()
+
+def _send_message():
     try:
         current_user_id = get_jwt_identity()
         data = request.get_json()
@@ -24,31 +478,21 @@ def send_message():
         session_id = data.get('session_id') or str(uuid.uuid4())
         
         # Store user message
-        user_message = ChatMessage(
-            user_id=current_user_id,
-            message=data['message'],
-            is_bot=False,
-            session_id=session_id,
-            message_metadata={}
-        )
-        db.session.add(user_message)
-        db.session.commit()
+        _save_user_message(current_user_id, session_id, data['message'])
         
         try:
             # Get conversation history for context
-            conversation_history = ChatMessage.query.filter_by(
-                user_id=current_user_id,
-                session_id=session_id
-            ).order_by(ChatMessage.created_at.desc()).limit(10).all()
+            history_list = _load_history(current_user_id, session_id)
             
-            history_list = [msg.to_dict() for msg in reversed(conversation_history)]
+            if gemini_service.pipeline_mode == 'fused':
+                return _fused_turn(current_user_id, session_id, data['message'], history_list)
             
             # Analyze conversation intent
             conversation_analysis = gemini_service.handle_conversation(
                 data['message'], 
                 history_list
             )
-              # Handle different conversation types
+            # Handle different conversation types
             if conversation_analysis.get('intent') == 'greeting':
                 response_msg = gemini_service.generate_response(
                     data['message'], 
@@ -57,29 +501,14 @@ def send_message():
                 )
                 
                 # Generate welcome suggestions
-                suggestions = [
-                    "I need a laptop for work",
-                    "Show me gaming headphones",
-                    "Looking for a smartphone",
-                    "Best tablets for students",
-                    "Wireless earbuds under $100",
-                    "What's trending in electronics?"
-                ]
+                suggestions = gemini_service._fallback_suggestions('greeting', [])
                 
-                bot_message = ChatMessage(
-                    user_id=current_user_id,
-                    message=response_msg,
-                    is_bot=True,
-                    session_id=session_id,
-                    message_metadata={
-                        'conversation_analysis': conversation_analysis,
-                        'suggestions': suggestions
-                    }
-                )
-                db.session.add(bot_message)
-                db.session.commit()
+                _save_bot_message(current_user_id, session_id, response_msg, {
+                    'conversation_analysis': conversation_analysis,
+                    'suggestions': suggestions
+                })
                 
-                return jsonify({
+                return _chat_response({
                     'message': response_msg,
                     'session_id': session_id,
                     'products': [],
@@ -88,16 +517,13 @@ def send_message():
                 })
             
             elif conversation_analysis.get('needs_products', True):
-                # Parse query for product search
-                filters = gemini_service.parse_query(data['message'])                # Check if user is looking for non-electronics items
+                # Parse query for product search, searching the catalog meanwhile
+                filters, product_list = _parse_and_search(data['message'])
+                # Check if user is looking for non-electronics items
                 if not filters:
-                    non_electronics_keywords = [
-                        'jeans', 'clothes', 'clothing', 'shoes', 'shirt', 'dress', 'pants', 
-                        'jacket', 'furniture', 'food', 'books', 'medicine', 'grocery'
-                    ]
                     user_query_lower = data['message'].lower()
                     
-                    if any(keyword in user_query_lower for keyword in non_electronics_keywords):
+                    if any(keyword in user_query_lower for keyword in NON_ELECTRONICS_KEYWORDS):
                         response_msg = gemini_service.generate_response(
                             f"Customer asked about non-electronics: {data['message']}", 
                             [], 
@@ -111,195 +537,55 @@ def send_message():
                         )
                     
                     # Generate clarification suggestions
-                    suggestions = [
-                        "Show me laptops instead",
-                        "I need smartphones", 
-                        "Looking for headphones",
-                        "Show me tablets",
-                        "Any gaming accessories?",
-                        "What electronics do you have?"
-                    ]
+                    suggestions = gemini_service._fallback_suggestions('clarification', [])
                     
-                    bot_message = ChatMessage(
-                        user_id=current_user_id,
-                        message=response_msg,
-                        is_bot=True,
-                        session_id=session_id,
-                        message_metadata={
-                            'conversation_analysis': conversation_analysis,
-                            'suggestions': suggestions
-                        }
-                    )
-                    db.session.add(bot_message)
-                    db.session.commit()
+                    _save_bot_message(current_user_id, session_id, response_msg, {
+                        'conversation_analysis': conversation_analysis,
+                        'suggestions': suggestions
+                    })
                     
-                    return jsonify({
+                    return _chat_response({
                         'message': response_msg,
                         'session_id': session_id,
                         'products': [],
                         'conversation_type': 'clarification',
                         'suggestions': suggestions
                     })
-                  # Build product query with enhanced filters
-                query = Product.query
                 
-                # Handle special cases for broader matching
-                user_query_lower = data['message'].lower()
-                
-                # Special handling for headphones/headsets queries
-                if any(keyword in user_query_lower for keyword in ['headphone', 'headset', 'earbuds']):
-                    # Search in both audio and gaming categories for headphone-related products
-                    audio_headphones = []
-                    gaming_headsets = []
-                    
-                    # Get audio headphones/earbuds
-                    audio_query = Product.query.filter(
-                        Product.category == 'audio',
-                        Product.subcategory.in_(['headphones', 'earbuds'])
-                    )
-                    
-                    # Get gaming headsets
-                    gaming_query = Product.query.filter(
-                        Product.category == 'gaming',
-                        Product.subcategory == 'headsets'
-                    )
-                    
-                    # Apply price filter to both queries
-                    if filters.get('price_range'):
-                        if filters['price_range'].get('min'):
-                            audio_query = audio_query.filter(Product.price >= filters['price_range']['min'])
-                            gaming_query = gaming_query.filter(Product.price >= filters['price_range']['min'])
-                        if filters['price_range'].get('max'):
-                            audio_query = audio_query.filter(Product.price <= filters['price_range']['max'])
-                            gaming_query = gaming_query.filter(Product.price <= filters['price_range']['max'])
-                    
-                    # Apply other filters
-                    if filters.get('color'):
-                        audio_query = audio_query.filter(Product.color == filters['color'])
-                        gaming_query = gaming_query.filter(Product.color == filters['color'])
-                    if filters.get('storage'):
-                        audio_query = audio_query.filter(Product.size == filters['storage'])
-                        gaming_query = gaming_query.filter(Product.size == filters['storage'])
-                    
-                    # Combine results
-                    audio_products = audio_query.all()
-                    gaming_products = gaming_query.all()
-                    
-                    # Merge and deduplicate
-                    all_products = audio_products + gaming_products
-                    seen_ids = set()
-                    products = []
-                    for p in all_products:
-                        if p.id not in seen_ids:
-                            products.append(p)
-                            seen_ids.add(p.id)
-                      # Sort by rating and stock
-                    products.sort(key=lambda x: (-x.rating, -x.stock_quantity))
-                    products = products[:20]
-                
-                else:
-                    # Use OR logic for broader, more inclusive product matching
-                    # This will show more products instead of being overly restrictive
-                    
-                    # Build OR conditions for broader category matching
-                    category_conditions = []
-                    
-                    # Add the parsed category/subcategory
-                    if filters.get('category'):
-                        category_conditions.append(Product.category == filters['category'])
-                    if filters.get('subcategory'):
-                        category_conditions.append(Product.subcategory == filters['subcategory'])
-                      # Special handling for phone queries - include all phone-related categories
-                    user_query_lower = data['message'].lower()
-                    if any(keyword in user_query_lower for keyword in ['phone', 'mobile', 'smartphone']):
-                        category_conditions.extend([
-                            Product.category == 'smartphones',
-                            Product.subcategory == 'smartphones'
-                        ])
-                        
-                        # For performance/flagship phones, include premium and gaming styles
-                        if any(keyword in user_query_lower for keyword in ['performance', 'best', 'flagship', 'powerful', 'fast']):
-                            category_conditions.extend([
-                                Product.style == 'premium',
-                                Product.style == 'gaming',
-                                Product.subcategory == 'flagship'
-                            ])
-                    
-                    # For casual/budget queries, show more product styles
-                    if any(keyword in user_query_lower for keyword in ['casual', 'budget', 'cheap', 'affordable', 'low price']):
-                        category_conditions.extend([
-                            Product.style == 'budget',
-                            Product.style == 'student',
-                            Product.style == 'casual'
-                        ])
-                    
-                    # Apply category conditions with OR logic (show if ANY condition matches)
-                    if category_conditions:
-                        query = query.filter(or_(*category_conditions))
-                    
-                    # Apply price filters (these are mandatory - use AND logic)
-                    if filters.get('price_range'):
-                        if filters['price_range'].get('min'):
-                            query = query.filter(Product.price >= filters['price_range']['min'])
-                        if filters['price_range'].get('max'):
-                            query = query.filter(Product.price <= filters['price_range']['max'])
-                    
-                    # Execute query and get results
-                    products = query.order_by(
-                        Product.rating.desc(),
-                        Product.stock_quantity.desc()
-                    ).limit(20).all()
-                    
-                    # If no products found, fallback to broader search (remove category restrictions)
-                    if not products:
-                        fallback_query = Product.query
-                        if filters.get('price_range'):
-                            if filters['price_range'].get('min'):
-                                fallback_query = fallback_query.filter(Product.price >= filters['price_range']['min'])
-                            if filters['price_range'].get('max'):
-                                fallback_query = fallback_query.filter(Product.price <= filters['price_range']['max'])
-                        products = fallback_query.order_by(
-                            Product.rating.desc(),
-                            Product.stock_quantity.desc()
-                        ).limit(10).all()
-                
-                product_list = [product.to_dict() for product in products]
-                  # Generate intelligent response using Gemini
                 response_msg = gemini_service.generate_response(
-                    data['message'], 
-                    product_list, 
-                    history_list
-                )
-                
-                # Generate smart suggestions for next questions
-                suggestions = gemini_service.generate_suggestions(
                     data['message'],
                     product_list,
-                    'product_recommendation'
+                    history_list
                 )
                 
+                # Follow-up suggestions come from the suggestion bank; when it
+                # has no match they are generated after the reply is sent and
+                # the message carries the generic ones until then
+                suggestions = gemini_service.suggestion_bank.match('product_recommendation', product_list, filters)
+                suggestions_pending = not suggestions and gemini_service._api_available()
+                if not suggestions:
+                    suggestions = gemini_service._fallback_suggestions('product_recommendation', product_list, filters)
+                
                 # Store bot response
-                bot_message = ChatMessage(
-                    user_id=current_user_id,
-                    message=response_msg,
-                    is_bot=True,
-                    session_id=session_id,
-                    message_metadata={
-                        'filters': filters,
-                        'conversation_analysis': conversation_analysis,
-                        'product_count': len(product_list),
-                        'suggestions': suggestions
-                    }
-                )
-                db.session.add(bot_message)
-                db.session.commit()
+                bot_message = _save_bot_message(current_user_id, session_id, response_msg, {
+                    'filters': filters,
+                    'conversation_analysis': conversation_analysis,
+                    'product_count': len(product_list),
+                    'suggestions': suggestions,
+                    'suggestions_status': 'pending' if suggestions_pending else 'fallback'
+                })
+                if suggestions_pending:
+                    _defer_suggestions(bot_message, data['message'], product_list, 'product_recommendation', filters)
                 
-                return jsonify({
+                return _chat_response({
                     'message': response_msg,
+                    'message_id': bot_message.id,
                     'session_id': session_id,
                     'products': product_list[:8],  # Return top 8 for display
-                    'conversation_type': 'product_recommendation',                    'total_found': len(product_list),
-                    'suggestions': suggestions
+                    'conversation_type': 'product_recommendation',
+                    'total_found': len(product_list),
+                    'suggestions': suggestions,
+                    'suggestions_pending': suggestions_pending
                 })
             
             else:
@@ -311,29 +597,14 @@ def send_message():
                 )
                 
                 # Generate general help suggestions
-                suggestions = [
-                    "Help me find a laptop",
-                    "Show me trending products", 
-                    "What's on sale?",
-                    "I need tech for work",
-                    "Best gaming gear",
-                    "Show me budget options"
-                ]
+                suggestions = gemini_service._fallback_suggestions('general_help', [])
                 
-                bot_message = ChatMessage(
-                    user_id=current_user_id,
-                    message=response_msg,
-                    is_bot=True,
-                    session_id=session_id,
-                    message_metadata={
-                        'conversation_analysis': conversation_analysis,
-                        'suggestions': suggestions
-                    }
-                )
-                db.session.add(bot_message)
-                db.session.commit()
+                _save_bot_message(current_user_id, session_id, response_msg, {
+                    'conversation_analysis': conversation_analysis,
+                    'suggestions': suggestions
+                })
                 
-                return jsonify({
+                return _chat_response({
                     'message': response_msg,
                     'session_id': session_id,
                     'products': [],
@@ -343,20 +614,13 @@ def send_message():
             
         except Exception as e:
             db.session.rollback()
-            print(f"Error processing message: {str(e)}")            # Fallback response
-            fallback_msg = "Welcome to NexTechAI! 🚀 I'm Alex, your personal AI shopping assistant here to help you discover the perfect technology solutions from our premium electronics collection. What cutting-edge tech can I help you find today? We specialize in laptops, smartphones, gaming gear, audio equipment, and much more!"
+            print(f"Error processing message: {str(e)}")
+            # Fallback response
+            fallback_msg = FALLBACK_MESSAGE
             
-            bot_message = ChatMessage(
-                user_id=current_user_id,
-                message=fallback_msg,
-                is_bot=True,
-                session_id=session_id,
-                message_metadata={'error': 'processing_error'}
-            )
-            db.session.add(bot_message)
-            db.session.commit()
+            _save_bot_message(current_user_id, session_id, fallback_msg, {'error': 'processing_error'})
             
-            return jsonify({
+            return _chat_response({
                 'message': fallback_msg,
                 'session_id': session_id,
                 'products': [],
@@ -367,6 +631,168 @@ def send_message():
         print(f"Unexpected error: {str(e)}")
         return jsonify({'error': 'An unexpected error occurred'}), 500
 
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@chat_bp.route('/message/stream', methods=['POST'])
+@jwt_required()
+@rate_limited
+def stream_message():
+    """Server-sent events version of /message.
+
+    Events, in order: ``session``, ``products`` (as soon as the catalog
+    search is done), ``token`` for each chunk of the reply, ``suggestions``
+    and finally ``done`` once the bot message has been stored.
+    """
+    try:
+        current_user_id = get_jwt_identity()
+        data = request.get_json()
+        
+        if not data or 'message' not in data:
+            return jsonify({'error': 'Message is required'}), 400
+        
+        session_id = data.get('session_id') or str(uuid.uuid4())
+        message = data['message']
+        _save_user_message(current_user_id, session_id, message)
+        turn_deadline = _turn_deadline()
+        with deadline.activate(turn_deadline):
+            history_list = _load_history(current_user_id, session_id)
+    except Exception as e:
+        print(f"Unexpected error: {str(e)}")
+        return jsonify({'error': 'An unexpected error occurred'}), 500
+    
+    def generate():
+        # Everything the stream does counts against the turn's deadline
+        with deadline.activate(turn_deadline):
+            yield from events()
+    
+    def events():
+        suggestions_cancel = threading.Event()
+        yield _sse('session', {'session_id': session_id})
+        try:
+            conversation_analysis = gemini_service.handle_conversation(message, history_list)
+            filters = {}
+            product_list = []
+            suggestions_future = None
+            reply_query = message
+            
+            if conversation_analysis.get('intent') == 'greeting':
+                conversation_type = 'greeting'
+                suggestions = gemini_service._fallback_suggestions(conversation_type, [])
+            elif conversation_analysis.get('needs_products', True):
+                filters, product_list = _parse_and_search(message)
+                if filters:
+                    conversation_type = 'product_recommendation'
+                    suggestions = gemini_service.suggestion_bank.match(conversation_type, product_list, filters)
+                    if not suggestions:
+                        # Suggestions run while the reply streams
+                        suggestions_future = gemini_service.submit(
+                            gemini_service.generate_suggestions, message, product_list, conversation_type, filters,
+                            cancel_event=suggestions_cancel
+                        )
+                else:
+                    conversation_type = 'clarification'
+                    suggestions = gemini_service._fallback_suggestions(conversation_type, [])
+                    if any(keyword in message.lower() for keyword in NON_ELECTRONICS_KEYWORDS):
+                        reply_query = f"Customer asked about non-electronics: {message}"
+            else:
+                conversation_type = 'general_help'
+                suggestions = gemini_service._fallback_suggestions(conversation_type, [])
+            
+            yield _sse('products', {
+                'conversation_type': conversation_type,
+                'products': product_list[:8],
+                'total_found': len(product_list)
+            })
+            
+            chunks = []
+            for chunk in gemini_service.stream_response(reply_query, product_list, history_list):
+                chunks.append(chunk)
+                yield _sse('token', {'text': chunk})
+            response_msg = ''.join(chunks).strip()
+            
+            if suggestions_future is not None:
+                try:
+                    suggestions = suggestions_future.result(timeout=deadline.remaining(gemini_service.suggestions_timeout))
+                except Exception as e:
+                    suggestions_cancel.set()
+                    suggestions_future.cancel()
+                    deadline.degrade('suggestions', 'timeout')
+                    print(f"Streaming suggestions unavailable: {str(e)}")
+                    suggestions = gemini_service._fallback_suggestions(conversation_type, product_list, filters)
+            
+            metadata = {
+                'conversation_analysis': conversation_analysis,
+                'suggestions': suggestions,
+                'streamed': True
+            }
+            if turn_deadline.degraded():
+                metadata['degraded'] = turn_deadline.degraded()
+            if conversation_type == 'product_recommendation':
+                metadata['filters'] = filters
+                metadata['product_count'] = len(product_list)
+            bot_message = _save_bot_message(current_user_id, session_id, response_msg, metadata)
+            
+            yield _sse('suggestions', {'suggestions': suggestions})
+            yield _sse('done', {
+                'message_id': bot_message.id,
+                'message': response_msg,
+                'session_id': session_id,
+                'conversation_type': conversation_type,
+                'degraded': turn_deadline.degraded()
+            })
+        
+        except Exception as e:
+            db.session.rollback()
+            print(f"Error streaming message: {str(e)}")
+            bot_message = _save_bot_message(current_user_id, session_id, FALLBACK_MESSAGE, {'error': 'processing_error'})
+            yield _sse('error', {
+                'message_id': bot_message.id,
+                'message': FALLBACK_MESSAGE,
+                'session_id': session_id,
+                'conversation_type': 'error_recovery'
+            })
+        finally:
+            # Stops the suggestions call if the client went away mid-stream
+            suggestions_cancel.set()
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+@chat_bp.route('/suggestions/<int:message_id>', methods=['GET'])
+@jwt_required()
+def get_message_suggestions(message_id):
+    """Follow-up suggestions of a bot message, including deferred ones.
+
+    ``status`` is ``pending`` while they are still being generated, then
+    ``ready`` (or ``fallback`` when generation failed).
+    """
+    try:
+        current_user_id = get_jwt_identity()
+        bot_message = ChatMessage.query.filter_by(
+            id=message_id,
+            user_id=current_user_id,
+            is_bot=True
+        ).first()
+        if not bot_message:
+            return jsonify({'error': 'Message not found'}), 404
+        
+        metadata = bot_message.message_metadata or {}
+        return jsonify({
+            'message_id': bot_message.id,
+            'status': metadata.get('suggestions_status', 'ready'),
+            'suggestions': metadata.get('suggestions', [])
+        })
+    except Exception as e:
+        print(f"Error getting message suggestions: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 @chat_bp.route('/history', methods=['GET'])
 @jwt_required()
 def get_chat_history():
@@ -414,10 +840,13 @@ def clear_chat_history():
         session_id = request.args.get('session_id')
         
         query = ChatMessage.query.filter_by(user_id=current_user_id)
+        summaries = ChatSessionSummary.query.filter_by(user_id=current_user_id)
         if session_id:
             query = query.filter_by(session_id=session_id)
+            summaries = summaries.filter_by(session_id=session_id)
         
         query.delete()
+        summaries.delete()
         db.session.commit()
         
         return jsonify({'message': 'Chat history cleared successfully'})
@@ -31,4 +31,51 @@ class ChatMessage(db.Model):
         }
     
     def __repr__(self):
-        return f'<ChatMessage {self.id}>'
\ No newline at end of file
+        return f'<ChatMessage {self.id}>'
+
+
+class ChatSessionSummary(db.Model):
+    """Rolling summary of the older part of a chat session.
+
+    Messages up to ``summarized_until`` are folded into ``summary`` and no
+    longer sent to the LLM verbatim, which keeps prompt size flat for long
+    sessions.
+    """
+    __tablename__ = 'chat_session_summaries'
+    __table_args__ = (db.UniqueConstraint('user_id', 'session_id'),)
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    session_id = db.Column(db.String(100), nullable=False)
+    summary = db.Column(db.Text, default='')
+    summarized_until = db.Column(db.Integer, default=0)  # Last ChatMessage.id folded into the summary
+    message_count = db.Column(db.Integer, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __init__(self, user_id, session_id):
+        self.user_id = user_id
+        self.session_id = session_id
+        self.summary = ''
+        self.summarized_until = 0
+        self.message_count = 0
+    
+    def to_history_entry(self):
+        """The summary in the shape of a history message, for prompt building."""
+        return {
+            'id': self.summarized_until,
+            'message': self.summary,
+            'is_bot': False,
+            'is_summary': True
+        }
+    
+    def to_dict(self):
+        return {
+            'session_id': self.session_id,
+            'summary': self.summary,
+            'summarized_until': self.summarized_until,
+            'message_count': self.message_count,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+    
+    def __repr__(self):
+        return f'<ChatSessionSummary {self.session_id}>'
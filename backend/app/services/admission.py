@@ -0,0 +1,97 @@
+import os
+import threading
+from typing import Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: admission is limited per process only
+    fcntl = None
+
+# Blueprint name -> priority. Anything not listed (health checks, metrics)
+# is high priority and never shed.
+BLUEPRINT_PRIORITIES = {
+    'order': 'high',
+    'cart': 'high',
+    'products': 'medium',
+    'auth': 'medium',
+    'chat': 'low'
+}
+PRIORITIES = ('high', 'medium', 'low')
+
+
+def classify(blueprint: Optional[str]) -> str:
+    return BLUEPRINT_PRIORITIES.get(blueprint, 'high')
+
+
+class Admission:
+    """A request let in by AdmissionController; hand it back to release()."""
+
+    def __init__(self, priority: str, fd: Optional[int] = None):
+        self.priority = priority
+        self.fd = fd
+
+
+class AdmissionController:
+    """Caps in-flight requests per priority so chat load cannot take every
+    worker away from checkout and cart.
+
+    ``limits`` maps a priority to its maximum number of requests in flight;
+    priorities without a positive limit are always admitted. With
+    ``lock_dir`` the limit holds across all workers on the host: each
+    in-flight request holds an flock on one of ``limit`` slot files, and a
+    worker that dies releases its slots with it. Without it (or without
+    fcntl) requests are only counted within the process.
+    """
+
+    def __init__(self, limits: Dict[str, int], retry_after: int = 2, lock_dir: Optional[str] = None):
+        self.limits = {priority: limit for priority, limit in limits.items() if limit > 0}
+        self.retry_after = retry_after
+        self.lock_dir = lock_dir if lock_dir and fcntl is not None else None
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._in_flight = {priority: 0 for priority in PRIORITIES}
+        self._counters = {priority: {'admitted': 0, 'rejected': 0} for priority in PRIORITIES}
+
+    def _take_slot_file(self, priority: str, limit: int) -> Optional[int]:
+        for slot in range(limit):
+            fd = os.open(os.path.join(self.lock_dir, f"{priority}-{slot}.lock"), os.O_CREAT | os.O_RDWR, 0o644)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return fd
+            except OSError:
+                os.close(fd)
+        return None
+
+    def try_admit(self, priority: str) -> Optional[Admission]:
+        """Admit a request of ``priority``, or return None when its limit is
+        reached and it should be turned away."""
+        limit = self.limits.get(priority)
+        fd = None
+        with self._lock:
+            if limit and self.lock_dir is None and self._in_flight[priority] >= limit:
+                self._counters[priority]['rejected'] += 1
+                return None
+            if limit and self.lock_dir:
+                fd = self._take_slot_file(priority, limit)
+                if fd is None:
+                    self._counters[priority]['rejected'] += 1
+                    return None
+            self._in_flight[priority] += 1
+            self._counters[priority]['admitted'] += 1
+        return Admission(priority, fd)
+
+    def release(self, admission: Admission):
+        with self._lock:
+            self._in_flight[admission.priority] -= 1
+        if admission.fd is not None:
+            # Closing the descriptor drops its flock
+            os.close(admission.fd)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                priority: dict(self._counters[priority], in_flight=self._in_flight[priority],
+                               limit=self.limits.get(priority))
+                for priority in PRIORITIES
+            }
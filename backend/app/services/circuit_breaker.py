@@ -0,0 +1,88 @@
+import threading
+import time
+from typing import Dict
+
+
+class CircuitBreaker:
+    """Process-wide circuit breaker for an upstream dependency.
+
+    After ``failure_threshold`` consecutive failures the breaker opens and
+    callers should skip straight to their local fallbacks. Once
+    ``reset_timeout`` seconds have passed a single trial request is let
+    through (half-open); its outcome closes or re-opens the breaker.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._times_opened = 0
+        self._rejected = 0
+
+    def _refresh_state(self):
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            self._state = self.HALF_OPEN
+            self._trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._refresh_state()
+            return self._state
+
+    def is_open(self) -> bool:
+        """True while calls should not be attempted at all."""
+        return self.state == self.OPEN
+
+    def allow_request(self) -> bool:
+        """Reserve permission for one call; False means use the fallback."""
+        with self._lock:
+            self._refresh_state()
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            self._rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._consecutive_failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive_failures += 1
+            if self._state == self.HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self._times_opened += 1
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            self._refresh_state()
+            retry_in = None
+            if self._state == self.OPEN:
+                retry_in = round(max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at)), 1)
+            return {
+                'name': self.name,
+                'state': self._state,
+                'consecutive_failures': self._consecutive_failures,
+                'failure_threshold': self.failure_threshold,
+                'times_opened': self._times_opened,
+                'rejected_calls': self._rejected,
+                'retry_in_seconds': retry_in
+            }
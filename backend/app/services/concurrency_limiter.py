@@ -0,0 +1,131 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from .llm_metrics import metrics
+
+
+def parse_limits(raw: Optional[str]) -> Dict[str, int]:
+    """Per-task limits from e.g. GEMINI_CONCURRENCY_LIMITS="respond=4,suggest=2"."""
+    limits = {}
+    for item in (raw or '').split(','):
+        if '=' not in item:
+            continue
+        task, limit = item.split('=', 1)
+        try:
+            limits[task.strip()] = int(limit)
+        except ValueError:
+            print(f"Ignoring invalid concurrency limit for {task.strip()}: {limit}")
+    return limits
+
+
+class _TaskSlots:
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self.waiting = 0
+        self.condition = threading.Condition()
+
+
+class ConcurrencyLimiter:
+    """Caps the Gemini calls a process has in flight, per task.
+
+    A call over its task's limit waits in a queue of at most ``max_queue``
+    callers for up to ``queue_timeout`` seconds. When the queue is full or
+    the wait times out the call is refused and the caller answers from its
+    local fallback, which beats adding to a burst that Gemini would answer
+    with 429s. A limit of 0 or less leaves the task unlimited.
+    """
+
+    def __init__(self, limits: Dict[str, int] = None, default_limit: int = 16,
+                 max_queue: int = 32, queue_timeout: float = 5.0):
+        self.limits = limits or {}
+        self.default_limit = default_limit
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._lock = threading.Lock()
+        self._tasks = {}
+
+    def _slots(self, task: str) -> _TaskSlots:
+        with self._lock:
+            slots = self._tasks.get(task)
+            if slots is None:
+                slots = self._tasks[task] = _TaskSlots(self.limits.get(task, self.default_limit))
+            return slots
+
+    def acquire(self, task: str, timeout: float = None) -> Optional[str]:
+        """Take a slot for ``task``; returns None on success, otherwise why
+        the call was refused ('queue_full' or 'queue_timeout').
+
+        ``timeout`` caps the wait below ``queue_timeout``, e.g. to the time
+        left on the turn's deadline.
+        """
+        slots = self._slots(task)
+        if slots.limit <= 0:
+            return None
+        wait_limit = self.queue_timeout if timeout is None else min(self.queue_timeout, timeout)
+        started = time.monotonic()
+        with slots.condition:
+            if slots.in_flight < slots.limit:
+                slots.in_flight += 1
+                metrics.observe_queue_wait(task, 0.0, slots.waiting, slots.in_flight)
+                return None
+            if slots.waiting >= self.max_queue:
+                metrics.record_queue_rejection(task, 'queue_full')
+                return 'queue_full'
+
+            slots.waiting += 1
+            metrics.set_concurrency(task, slots.waiting, slots.in_flight)
+            try:
+                admitted = slots.condition.wait_for(lambda: slots.in_flight < slots.limit, timeout=wait_limit)
+            finally:
+                slots.waiting -= 1
+            waited = time.monotonic() - started
+            if not admitted:
+                metrics.observe_queue_wait(task, waited, slots.waiting, slots.in_flight)
+                metrics.record_queue_rejection(task, 'queue_timeout')
+                return 'queue_timeout'
+            slots.in_flight += 1
+            metrics.observe_queue_wait(task, waited, slots.waiting, slots.in_flight)
+            return None
+
+    def release(self, task: str):
+        slots = self._slots(task)
+        if slots.limit <= 0:
+            return
+        with slots.condition:
+            slots.in_flight -= 1
+            metrics.set_concurrency(task, slots.waiting, slots.in_flight)
+            slots.condition.notify()
+
+    @contextmanager
+    def slot(self, task: str, timeout: float = None):
+        """``with limiter.slot(task) as refused:`` runs the block holding a
+        slot when ``refused`` is None; the slot is released afterwards."""
+        refused = self.acquire(task, timeout)
+        try:
+            yield refused
+        finally:
+            if refused is None:
+                self.release(task)
+
+    def total_limit(self, tasks) -> int:
+        """Calls ``tasks`` may have in flight together; unlimited tasks
+        count as ``default_limit``."""
+        limits = [self.limits.get(task, self.default_limit) for task in tasks]
+        return sum(limit if limit > 0 else self.default_limit for limit in limits)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            tasks = dict(self._tasks)
+        result = {}
+        for task, slots in sorted(tasks.items()):
+            with slots.condition:
+                result[task] = {'limit': slots.limit, 'in_flight': slots.in_flight, 'waiting': slots.waiting}
+        return {
+            'default_limit': self.default_limit,
+            'max_queue': self.max_queue,
+            'queue_timeout': self.queue_timeout,
+            'tasks': result
+        }
@@ -0,0 +1,67 @@
+import re
+from typing import Dict, List
+
+INTERESTS_PREFIX = 'Interests: '
+
+_SENTENCE_END = re.compile(r'(?<=[.!?])\s')
+
+
+def _first_sentence(text: str, limit: int) -> str:
+    text = ' '.join(text.split())
+    sentence = _SENTENCE_END.split(text, 1)[0]
+    if len(sentence) > limit:
+        sentence = sentence[:limit].rsplit(' ', 1)[0] + '...'
+    return sentence
+
+
+def _interests_from(messages: List[Dict]) -> List[str]:
+    """Search interests recorded in bot message metadata (category, style, budget)."""
+    interests = []
+    for msg in messages:
+        filters = (msg.get('message_metadata') or {}).get('filters') or {}
+        for field in ('category', 'subcategory', 'style', 'color', 'storage'):
+            if filters.get(field):
+                interests.append(str(filters[field]))
+        price_range = filters.get('price_range') or {}
+        if price_range.get('max'):
+            interests.append(f"budget up to ${price_range['max']}")
+        if price_range.get('min'):
+            interests.append(f"budget from ${price_range['min']}")
+    return interests
+
+
+def summarize_message(msg: Dict, limit: int = 160) -> str:
+    if msg.get('is_bot'):
+        line = f"Alex: {_first_sentence(msg.get('message', ''), limit)}"
+        product_count = (msg.get('message_metadata') or {}).get('product_count')
+        if product_count:
+            line += f" (showed {product_count} products)"
+        return line
+    return f"Customer: {_first_sentence(msg.get('message', ''), limit)}"
+
+
+def fold_into_summary(summary: str, messages: List[Dict], max_chars: int = 1200) -> str:
+    """Fold messages into an existing rolling summary.
+
+    The summary is one line of accumulated interests followed by one short
+    line per folded message. When it grows past ``max_chars`` the oldest
+    message lines are dropped, so its size stays bounded however long the
+    session runs.
+    """
+    lines = [line for line in (summary or '').split('\n') if line]
+    interests = []
+    if lines and lines[0].startswith(INTERESTS_PREFIX):
+        interests = [item for item in lines.pop(0)[len(INTERESTS_PREFIX):].split(', ') if item]
+
+    for interest in _interests_from(messages):
+        if interest in interests:
+            interests.remove(interest)
+        interests.append(interest)
+    # Most recent interests matter most
+    interests = interests[-8:]
+
+    lines.extend(summarize_message(msg) for msg in messages)
+    header = [INTERESTS_PREFIX + ', '.join(interests)] if interests else []
+    while lines and len('\n'.join(header + lines)) > max_chars:
+        lines.pop(0)
+    return '\n'.join(header + lines)
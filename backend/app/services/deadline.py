@@ -0,0 +1,64 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+_state = threading.local()
+
+
+class Deadline:
+    """Time budget for one chat turn, shared by every stage of it.
+
+    Stages ask for the ``remaining`` time to size their own timeouts and
+    call ``degrade`` when they answered from a local fallback, so the
+    endpoint can report which parts of the reply are second-best.
+    """
+
+    def __init__(self, budget: float):
+        self.budget = budget
+        self.expires_at = time.monotonic() + budget
+        self._lock = threading.Lock()
+        self._degraded = {}
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def degrade(self, stage: str, reason: str):
+        with self._lock:
+            # Keep the first reason; later ones are usually a consequence
+            self._degraded.setdefault(stage, reason)
+
+    def degraded(self) -> Dict[str, str]:
+        with self._lock:
+            return dict(self._degraded)
+
+
+def current() -> Optional[Deadline]:
+    """The deadline of the turn running on this thread, if any."""
+    return getattr(_state, 'deadline', None)
+
+
+@contextmanager
+def activate(deadline: Optional[Deadline]):
+    """Make ``deadline`` current on this thread for the duration of the block."""
+    previous = current()
+    _state.deadline = deadline
+    try:
+        yield deadline
+    finally:
+        _state.deadline = previous
+
+
+def remaining(default: float) -> float:
+    """``default`` capped by the time left on the current deadline."""
+    deadline = current()
+    return default if deadline is None else min(default, deadline.remaining())
+
+
+def degrade(stage: str, reason: str):
+    deadline = current()
+    if deadline is not None:
+        deadline.degrade(stage, reason)
@@ -0,0 +1,125 @@
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .circuit_breaker import CircuitBreaker
+
+# One pooled keep-alive session per process for all Gemini traffic, so chat
+# turns reuse TCP+TLS connections instead of handshaking on every call.
+_session = None
+_session_pid = None
+_lock = threading.Lock()
+_counters = {
+    'requests': 0,
+    'errors': 0
+}
+
+# Shared by every GeminiService call in this process; while open, callers
+# go straight to their keyword fallbacks instead of tying up a worker.
+breaker = CircuitBreaker(
+    'gemini',
+    failure_threshold=int(os.getenv('GEMINI_BREAKER_FAILURES', '5')),
+    reset_timeout=float(os.getenv('GEMINI_BREAKER_RESET_SECONDS', '30'))
+)
+
+
+def _pool_size() -> int:
+    return int(os.getenv('GEMINI_POOL_SIZE', '10'))
+
+
+def get_timeouts():
+    """(connect, read) timeout pair for Gemini requests."""
+    return (
+        float(os.getenv('GEMINI_CONNECT_TIMEOUT', '5')),
+        float(os.getenv('GEMINI_READ_TIMEOUT', '30'))
+    )
+
+
+def get_session() -> requests.Session:
+    """Return the process-wide Gemini session, rebuilding it after a fork."""
+    global _session, _session_pid
+    pid = os.getpid()
+    if _session is None or _session_pid != pid:
+        with _lock:
+            if _session is None or _session_pid != pid:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=_pool_size(),
+                    max_retries=0
+                )
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                session.headers.update({
+                    'Content-Type': 'application/json',
+                    'Connection': 'keep-alive'
+                })
+                _session = session
+                _session_pid = pid
+    return _session
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    """POST through the pooled session with split connect/read timeouts."""
+    kwargs.setdefault('timeout', get_timeouts())
+    with _lock:
+        _counters['requests'] += 1
+    try:
+        return get_session().post(url, **kwargs)
+    except requests.exceptions.RequestException:
+        with _lock:
+            _counters['errors'] += 1
+        raise
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter for the given zero-based attempt."""
+    base = float(os.getenv('GEMINI_RETRY_BASE_DELAY', '0.5'))
+    cap = max_retry_delay()
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def max_retry_delay() -> float:
+    return float(os.getenv('GEMINI_RETRY_MAX_DELAY', '8'))
+
+
+def pool_stats() -> Dict:
+    """Connection pool usage counters for this process."""
+    stats = {
+        'pool_size': _pool_size(),
+        'requests': _counters['requests'],
+        'errors': _counters['errors'],
+        'connections_opened': 0,
+        'connections_reused': 0
+    }
+    if _session is None or _session_pid != os.getpid():
+        return stats
+
+    adapter = _session.get_adapter('https://')
+    for key in adapter.poolmanager.pools.keys():
+        pool = adapter.poolmanager.pools.get(key)
+        if pool is None:
+            continue
+        stats['connections_opened'] += pool.num_connections
+    stats['connections_reused'] = max(0, stats['requests'] - stats['errors'] - stats['connections_opened'])
+    return stats
@@ -2,34 +2,110 @@ import requests
 import os
 from dotenv import load_dotenv
 import logging
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 import json
 import re
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from . import deadline, gemini_http, single_flight
+from .circuit_breaker import CircuitBreaker
+from .concurrency_limiter import ConcurrencyLimiter, parse_limits
+from .hedging import HedgePolicy
+from .llm_cache import ResponseCache
+from .llm_metrics import metrics
+from .llm_schemas import IntentAnalysis, SchemaError, SearchFilters, TurnResult, structured_output
+from .llm_traffic import TrafficLog
+from .intent_classifier import IntentClassifier
+from .prompt_builder import PromptBuilder
+from .suggestion_bank import DEFAULT_BANK_PATH, SuggestionBank
+from .query_canonicalizer import FilterMemo, canonicalize, normalize_prices
 
 # Load environment variables
 load_dotenv()
 
+
+def _worker_concurrency() -> int:
+    """Requests one gunicorn worker serves at once, per gunicorn.conf.py."""
+    if os.getenv('GUNICORN_WORKER_CLASS', 'sync') == 'gevent':
+        return int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '1000'))
+    # gunicorn runs sync workers with more than one thread as gthread
+    return int(os.getenv('GUNICORN_THREADS', '1'))
+
 class GeminiService:
+    # Tasks whose calls go through _make_api_request
+    LLM_TASKS = ('intent', 'parse', 'respond', 'suggest', 'turn')
+    UNAVAILABLE_REPLY = "I apologize, but I'm unable to process your request right now. Please try again later!"
+    THANKS_REPLY = "You're very welcome! 😊 If you need anything else - a new laptop, phone, headphones or gaming gear - just ask and I'll find the best NexTechAI options for you."
+    DEFAULT_REPLY = "Hi there! I'm Alex from NexTechAI, and I'm here to help you discover amazing technology solutions! 🚀 Could you tell me what kind of premium electronics you're looking for? Whether it's laptops, smartphones, gaming gear, or audio equipment - I'll find the perfect NexTechAI products for you!"
+
     def __init__(self):
-        self.api_key = os.getenv('GEMINI_API_KEY')
-        if not self.api_key:
-            print("GEMINI_API_KEY not set in environment variables")
-            self.api_url = None
-            return
-        
-        # Use REST API endpoint that works
-        self.api_url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={self.api_key}"
-          # Test the API connection
-        try:
-            test_response = self._make_api_request("Hello, test connection")
-            if test_response:
-                print("✅ Successfully initialized Gemini service with REST API")
-            else:
-                print("❌ Failed to connect to Gemini API")
-                self.api_url = None
-        except Exception as e:
-            print(f"❌ Error initializing Gemini service: {e}")
-            self.api_url = None        # Enhanced conversational system prompt
+        # 'fused' answers a chat turn with one structured call, 'multi' keeps
+        # the original intent -> parse -> respond -> suggest chain
+        self.pipeline_mode = os.getenv('GEMINI_PIPELINE_MODE', 'fused').lower()
+        # Bounded pool for independent LLM calls that can run side by side.
+        # A turn keeps at most one call on it, so by default it has a thread
+        # for every request the worker can serve at once
+        self.executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv('GEMINI_MAX_PARALLEL_CALLS') or max(8, _worker_concurrency())),
+            thread_name_prefix='gemini'
+        )
+        # Separate pool for work done after the response has been sent, so
+        # it never queues ahead of calls a request is waiting on
+        self.background_executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv('GEMINI_BACKGROUND_WORKERS', '2')),
+            thread_name_prefix='gemini-bg'
+        )
+        self.suggestions_timeout = float(os.getenv('GEMINI_SUGGESTIONS_TIMEOUT', '8'))
+        # Calls are skipped for their fallback when the turn's deadline
+        # leaves less than this many seconds
+        self.deadline_min_call = float(os.getenv('GEMINI_DEADLINE_MIN_CALL', '1.0'))
+        # Ask Gemini for JSON matching each task's response schema
+        self.structured_output = os.getenv('GEMINI_STRUCTURED_OUTPUT', 'true').lower() == 'true'
+        self._call_state = threading.local()
+        self.cache = ResponseCache()
+        self.intent_classifier = IntentClassifier(float(os.getenv('GEMINI_INTENT_CONFIDENCE', '0.8')))
+        self.parse_memo = FilterMemo(int(os.getenv('GEMINI_PARSE_MEMO_SIZE', '2048')))
+        # GEMINI_TRAFFIC_MODE=record|replay captures or serves back Gemini
+        # calls for like-for-like benchmarks without network access
+        self.traffic = TrafficLog(
+            os.getenv('GEMINI_TRAFFIC_MODE', 'off').lower(),
+            os.getenv('GEMINI_TRAFFIC_LOG'),
+            float(os.getenv('GEMINI_REPLAY_LATENCY_SCALE', '1.0'))
+        )
+        self.suggestion_bank = SuggestionBank.load(os.getenv('SUGGESTION_BANK_PATH') or DEFAULT_BANK_PATH)
+        self.single_flight = single_flight.SingleFlight(
+            wait_timeout=float(os.getenv('GEMINI_SINGLE_FLIGHT_WAIT', '30')),
+            lock_dir=os.getenv('GEMINI_SINGLE_FLIGHT_DIR') or None
+        )
+        # Per-task caps on concurrent Gemini calls, with a bounded wait queue
+        self.limiter = ConcurrencyLimiter(
+            limits=parse_limits(os.getenv('GEMINI_CONCURRENCY_LIMITS')),
+            default_limit=int(os.getenv('GEMINI_CONCURRENCY_DEFAULT', '16')),
+            max_queue=int(os.getenv('GEMINI_QUEUE_MAX', '32')),
+            queue_timeout=float(os.getenv('GEMINI_QUEUE_TIMEOUT', '5'))
+        )
+        # Slow requests get a duplicate sent after the recent p95 latency.
+        # Hedged calls run their primary and duplicate on the hedge pool, so
+        # it fits every call the limiter admits twice over, plus the losers
+        # of a minute's hedges that may still be finishing
+        hedge_budget = int(os.getenv('GEMINI_HEDGE_BUDGET_PER_MINUTE', '30'))
+        self.hedging = HedgePolicy(
+            enabled=os.getenv('GEMINI_HEDGE_ENABLED', 'false').lower() == 'true',
+            percentile=float(os.getenv('GEMINI_HEDGE_PERCENTILE', '95')),
+            min_samples=int(os.getenv('GEMINI_HEDGE_MIN_SAMPLES', '20')),
+            min_delay=float(os.getenv('GEMINI_HEDGE_MIN_DELAY', '0.5')),
+            budget_per_minute=hedge_budget,
+            max_workers=int(os.getenv('GEMINI_HEDGE_WORKERS') or
+                            2 * self.limiter.total_limit(self.LLM_TASKS) + hedge_budget)
+        )
+        self.probe_interval = float(os.getenv('GEMINI_PROBE_INTERVAL', '60'))
+        self._probe_thread = None
+        self.last_probe_ok = None
+        self.last_probe_at = None
+
+        # Enhanced conversational system prompt
         self.system_prompt = """You are Alex, the premium AI shopping assistant at NexTechAI - the leading destination for cutting-edge electronics and smart technology solutions. You represent NexTechAI's commitment to innovation, quality, and exceptional customer experience.
 
 COMPANY IDENTITY - NexTechAI:
@@ -122,15 +198,76 @@ Return JSON with extracted filters:
 
 If not electronics-related, return: {}"""
 
-    def _make_api_request(self, prompt: str, max_retries: int = 3) -> str:
-        """Make a request to the Gemini REST API."""
-        if not self.api_url:
+        # No network traffic here: worker boot must not wait on Gemini. The
+        # background probe started by get_gemini_service() checks reachability.
+        self.api_key = os.getenv('GEMINI_API_KEY')
+        self.model = os.getenv('GEMINI_MODEL', 'gemini-2.0-flash')
+        if not self.api_key:
+            print("GEMINI_API_KEY not set in environment variables")
+            self.api_url = None
+            self.stream_url = None
+            self.cached_contents_url = None
+        else:
+            # GEMINI_API_BASE can point at a stand-in such as mock_gemini_server.py
+            api_base = os.getenv('GEMINI_API_BASE', 'https://generativelanguage.googleapis.com/v1beta').rstrip('/')
+            self.api_url = f"{api_base}/models/{self.model}:generateContent?key={self.api_key}"
+            self.stream_url = f"{api_base}/models/{self.model}:streamGenerateContent?alt=sse&key={self.api_key}"
+            self.cached_contents_url = f"{api_base}/cachedContents?key={self.api_key}"
+
+        # Static prompt sections are compiled once; the system prompt travels
+        # as a system instruction or, when enabled, a provider-side cache
+        self.prompts = PromptBuilder(self.system_prompt, {'parsing_prompt': self.parsing_prompt})
+        self.context_cache_enabled = os.getenv('GEMINI_CONTEXT_CACHE', 'false').lower() == 'true'
+        self.context_cache_ttl = int(os.getenv('GEMINI_CONTEXT_CACHE_TTL', '3600'))
+        self._context_cache = None
+        self._context_cache_retry_at = 0.0
+        self._context_cache_lock = threading.Lock()
+
+    def _context_cache_name(self, system: str):
+        """Name of the provider-side cached context holding ``system``.
+
+        Created on first use and refreshed shortly before it expires. If
+        Gemini refuses (for example because the prefix is below the minimum
+        cacheable size) the inline prefix is used until the next retry window.
+        """
+        if not self.context_cache_enabled or not self.cached_contents_url:
+            return None
+        now = time.monotonic()
+        cache = self._context_cache
+        if cache and cache['system'] == system and cache['expires_at'] > now:
+            return cache['name']
+        if now < self._context_cache_retry_at:
             return None
 
-        headers = {
-            'Content-Type': 'application/json'
-        }
+        with self._context_cache_lock:
+            cache = self._context_cache
+            if cache and cache['system'] == system and cache['expires_at'] > time.monotonic():
+                return cache['name']
+            body = {
+                "model": f"models/{self.model}",
+                "systemInstruction": {"parts": [{"text": system}]},
+                "ttl": f"{self.context_cache_ttl}s"
+            }
+            try:
+                response = gemini_http.post(self.cached_contents_url, json=body)
+                if response.status_code == 200:
+                    self._context_cache = {
+                        'name': response.json()['name'],
+                        'system': system,
+                        # Refresh a minute early so requests never race the expiry
+                        'expires_at': time.monotonic() + max(0, self.context_cache_ttl - 60)
+                    }
+                    return self._context_cache['name']
+                print(f"Context cache unavailable ({response.status_code}): {response.text[:200]}")
+            except Exception as e:
+                print(f"Context cache error: {e}")
+            self._context_cache = None
+            self._context_cache_retry_at = time.monotonic() + self.context_cache_ttl
+            return None
 
+    def _request_body(self, prompt: str, system: str = None, use_context_cache: bool = True,
+                      response_schema: Dict = None):
+        """Build a generateContent body; returns it with whether the prefix is provider-cached."""
         body = {
             "contents": [
                 {
@@ -142,53 +279,383 @@ If not electronics-related, return: {}"""
                 }
             ]
         }
+        if response_schema is not None:
+            body['generationConfig'] = structured_output(response_schema)
+        if not system:
+            return body, False
+        cache_name = self._context_cache_name(system) if use_context_cache else None
+        if cache_name:
+            body['cachedContent'] = cache_name
+            return body, True
+        body['systemInstruction'] = {"parts": [{"text": system}]}
+        return body, False
+
+    def _make_api_request(self, prompt: str, max_retries: int = 3, system: str = None, task: str = 'general',
+                          response_schema: Dict = None) -> str:
+        """Make a request to the Gemini REST API.
 
+        Identical requests already in flight are not sent again; the caller
+        waits for the in-flight one and shares its response. With
+        ``response_schema`` Gemini answers with JSON that matches it.
+        """
+        if self.traffic.replaying:
+            return self.traffic.replay(task, system, prompt)
+        if not self.api_url:
+            return None
+
+        def send():
+            with self.limiter.slot(task, timeout=deadline.remaining(self.limiter.queue_timeout)) as refused:
+                if refused:
+                    print(f"Gemini {task} call refused by the concurrency limiter ({refused})")
+                    deadline.degrade(task, refused)
+                    return None
+                started = time.monotonic()
+                response_text = self._send_api_request(prompt, max_retries, system, task, response_schema)
+            self.traffic.record(task, system, prompt, response_text, time.monotonic() - started)
+            return response_text
+
+        key = single_flight.make_key(task, system, prompt)
+        return self.single_flight.do(key, send, cancelled=self._call_cancelled)
+
+    @staticmethod
+    def _request_timeouts():
+        """(connect, read) timeouts, shortened to fit the turn's deadline."""
+        connect_timeout, read_timeout = gemini_http.get_timeouts()
+        return deadline.remaining(connect_timeout), deadline.remaining(read_timeout)
+
+    def _post(self, body: Dict, task: str) -> requests.Response:
+        """One generateContent attempt, hedged when hedging is enabled."""
+        timeouts = self._request_timeouts()
+        if not self.hedging.enabled:
+            return gemini_http.post(self.api_url, json=body, timeout=timeouts)
+        return self.hedging.post(
+            task,
+            lambda: gemini_http.post(self.api_url, json=body, timeout=timeouts, stream=True),
+            timeouts[1]
+        )
+
+    def _send_api_request(self, prompt: str, max_retries: int, system: str, task: str,
+                          response_schema: Dict = None) -> str:
+        body, prefix_cached = self._request_body(prompt, system, response_schema=response_schema)
+        self.prompts.record(task, system, prompt, prefix_cached)
+        prompt_chars = len(system or '') + len(prompt)
+
+        breaker = gemini_http.breaker
         for attempt in range(max_retries):
+            if self._call_cancelled():
+                return None
+            if not breaker.allow_request():
+                print("Gemini circuit breaker is open, skipping API call")
+                return None
+            if attempt:
+                metrics.record_retry(task)
+
+            retry_after = None
+            started = time.monotonic()
             try:
-                response = requests.post(
-                    self.api_url,
-                    headers=headers,
-                    json=body,
-                    timeout=30
-                )
+                response = self._post(body, task)
+                if response.status_code != 200:
+                    metrics.observe_request(task, time.monotonic() - started, response.status_code, prompt_chars)
                 
                 if response.status_code == 200:
+                    breaker.record_success()
                     data = response.json()
+                    text = None
                     if 'candidates' in data and len(data['candidates']) > 0:
-                        return data['candidates'][0]['content']['parts'][0]['text']
+                        text = data['candidates'][0]['content']['parts'][0]['text']
+                    metrics.observe_request(task, time.monotonic() - started, 200, prompt_chars,
+                                            len(text) if text is not None else None)
+                    if text is not None:
+                        return text
+                elif response.status_code == 429 or response.status_code >= 500:
+                    breaker.record_failure()
+                    retry_after = gemini_http.parse_retry_after(response.headers.get('Retry-After'))
+                    print(f"API request failed with status {response.status_code} (attempt {attempt + 1}): {response.text[:200]}")
+                elif 'cachedContent' in body and response.status_code in (400, 403, 404):
+                    # The cached prefix expired or was evicted upstream; resend inline
+                    breaker.record_success()
+                    print(f"Cached context rejected ({response.status_code}), sending prefix inline")
+                    self._context_cache = None
+                    body, _ = self._request_body(prompt, system, use_context_cache=False,
+                                                 response_schema=response_schema)
+                    continue
                 else:
+                    # Other client errors will not succeed on retry and say
+                    # nothing about upstream health
+                    breaker.record_success()
                     print(f"API request failed with status {response.status_code}: {response.text}")
+                    return None
                     
             except requests.exceptions.RequestException as e:
+                breaker.record_failure()
+                metrics.observe_request(task, time.monotonic() - started, 'error', prompt_chars)
                 print(f"Request error (attempt {attempt + 1}): {e}")
-                if attempt < max_retries - 1:
-                    continue
                     
             except Exception as e:
+                breaker.record_failure()
                 print(f"Unexpected error (attempt {attempt + 1}): {e}")
-                if attempt < max_retries - 1:
-                    continue
+
+            if attempt < max_retries - 1:
+                delay = gemini_http.retry_delay(attempt)
+                if retry_after is not None:
+                    if retry_after > gemini_http.max_retry_delay():
+                        # Waiting that long would pin the worker; let the caller fall back
+                        print(f"Retry-After of {retry_after:.1f}s exceeds retry budget, giving up")
+                        return None
+                    delay = max(delay, retry_after)
+                if deadline.remaining(delay + self.deadline_min_call) < delay + self.deadline_min_call:
+                    print("Not enough time left in the request deadline to retry")
+                    return None
+                time.sleep(delay)
 
         return None
 
+    def _cache_key(self, task: str, message: str, products: List[Dict] = None,
+                   history: List[Dict] = None, history_limit: int = 0, extra: str = '') -> str:
+        product_ids = [p.get('id') for p in products] if products else None
+        return self.cache.make_key(task, message, product_ids, history, history_limit, extra)
+
+    def _cached_api_request(self, task: str, prompt: str, message: str, products: List[Dict] = None,
+                            history: List[Dict] = None, history_limit: int = 0, extra: str = '',
+                            validate=None, system: str = None, response_schema: Dict = None) -> str:
+        """_make_api_request behind the response cache.
+
+        The key is built from the inputs that shape the prompt rather than
+        the prompt text itself. Responses are only stored when ``validate``
+        accepts them, so an unparseable answer is not replayed.
+        ``response_schema`` is only sent with GEMINI_STRUCTURED_OUTPUT on.
+        """
+        key = self._cache_key(task, message, products, history, history_limit, extra)
+        cached = self.cache.get(task, key)
+        if cached is not None:
+            return cached
+
+        if not self.structured_output:
+            response_schema = None
+        response_text = self._make_api_request(prompt, system=system, task=task, response_schema=response_schema)
+        if response_text and (validate is None or validate(response_text)):
+            self.cache.set(task, key, response_text)
+        return response_text
+
+    @staticmethod
+    def _parse_structured(task: str, response_text: str, model):
+        """``response_text`` validated into a ``model`` instance, or None.
+
+        Every outcome is counted so the share of paid calls lost to
+        malformed JSON shows up in /metrics.
+        """
+        if not response_text:
+            return None
+        try:
+            parsed = model.from_text(response_text)
+        except SchemaError as e:
+            metrics.record_structured_parse(task, e.reason)
+            print(f"Discarding {task} response ({e.reason}): {e}")
+            return None
+        metrics.record_structured_parse(task, 'ok')
+        return parsed
+
+    def _stream_api_request(self, prompt: str, system: str = None, task: str = 'respond'):
+        """Yield text chunks from Gemini's streamGenerateContent SSE endpoint.
+
+        Streams are not retried: once text has been shown to the user a
+        retry could not be spliced in cleanly. Returns True when the stream
+        ran to its end (Gemini sent a finishReason), False when it stopped
+        short or never started.
+        """
+        if self.traffic.replaying:
+            return (yield from self.traffic.replay_stream(task, system, prompt))
+        if not self.stream_url:
+            return False
+
+        with self.limiter.slot(task, timeout=deadline.remaining(self.limiter.queue_timeout)) as refused:
+            if refused:
+                print(f"Gemini {task} stream refused by the concurrency limiter ({refused})")
+                deadline.degrade(task, refused)
+                return False
+            return (yield from self._send_stream_request(prompt, system, task))
+
+    def _send_stream_request(self, prompt: str, system: str, task: str):
+        breaker = gemini_http.breaker
+        if not breaker.allow_request():
+            print("Gemini circuit breaker is open, skipping streaming call")
+            return False
+
+        body, prefix_cached = self._request_body(prompt, system)
+        self.prompts.record(task, system, prompt, prefix_cached)
+        prompt_chars = len(system or '') + len(prompt)
+        started = time.monotonic()
+        try:
+            response = gemini_http.post(self.stream_url, json=body, stream=True, timeout=self._request_timeouts())
+        except requests.exceptions.RequestException as e:
+            breaker.record_failure()
+            metrics.observe_request(task, time.monotonic() - started, 'error', prompt_chars)
+            self.traffic.record_stream(task, system, prompt, [], time.monotonic() - started)
+            print(f"Streaming request error: {e}")
+            return False
+
+        with response:
+            if response.status_code != 200:
+                metrics.observe_request(task, time.monotonic() - started, response.status_code, prompt_chars)
+                self.traffic.record_stream(task, system, prompt, [], time.monotonic() - started)
+                if response.status_code == 429 or response.status_code >= 500:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                print(f"Streaming request failed with status {response.status_code}")
+                return False
+
+            breaker.record_success()
+            # SSE responses carry no charset, so requests would hand back bytes
+            response.encoding = 'utf-8'
+            response_chars = 0
+            recorded_chunks = []
+            finished = False
+            try:
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith('data:'):
+                        continue
+                    try:
+                        data = json.loads(line[len('data:'):].strip())
+                    except ValueError:
+                        continue
+                    for candidate in data.get('candidates', [])[:1]:
+                        finished = finished or bool(candidate.get('finishReason'))
+                        for part in candidate.get('content', {}).get('parts', []):
+                            if part.get('text'):
+                                response_chars += len(part['text'])
+                                if self.traffic.recording:
+                                    recorded_chunks.append((time.monotonic() - started, part['text']))
+                                yield part['text']
+            finally:
+                # Latency of a stream is the time until its last chunk
+                elapsed = time.monotonic() - started
+                metrics.observe_request(task, elapsed, 200, prompt_chars, response_chars)
+                self.traffic.record_stream(task, system, prompt, recorded_chunks, elapsed)
+            return finished
+
+    def start_health_probe(self):
+        """Start the background probe that warms up and re-checks the API."""
+        if not self.api_url or self._probe_thread is not None:
+            return
+        self._probe_thread = threading.Thread(target=self._probe_loop, name='gemini-probe', daemon=True)
+        self._probe_thread.start()
+
+    def _probe_loop(self):
+        self.probe_api()
+        while True:
+            time.sleep(self.probe_interval)
+            # Only spend a call when the API is suspected to be down
+            if not self.last_probe_ok or gemini_http.breaker.state != CircuitBreaker.CLOSED:
+                self.probe_api()
+
+    def probe_api(self) -> bool:
+        """Send a one-token request and feed the outcome to the circuit breaker.
+
+        Runs regardless of breaker state, so a successful probe is what
+        re-enables the API after an outage.
+        """
+        body = {
+            "contents": [{"parts": [{"text": "ping"}]}],
+            "generationConfig": {"maxOutputTokens": 1}
+        }
+        try:
+            response = gemini_http.post(self.api_url, json=body)
+            ok = response.status_code == 200
+            if not ok:
+                print(f"Gemini health probe failed with status {response.status_code}")
+        except requests.exceptions.RequestException as e:
+            print(f"Gemini health probe error: {e}")
+            ok = False
+
+        if ok:
+            if self.last_probe_ok is not True:
+                print("✅ Gemini API reachable")
+            gemini_http.breaker.record_success()
+        else:
+            gemini_http.breaker.record_failure()
+        self.last_probe_ok = ok
+        self.last_probe_at = datetime.utcnow().isoformat()
+        return ok
+
+    def status(self) -> Dict:
+        return {
+            'configured': bool(self.api_url),
+            'pipeline_mode': self.pipeline_mode,
+            'last_probe_ok': self.last_probe_ok,
+            'last_probe_at': self.last_probe_at
+        }
+
+    def _api_available(self) -> bool:
+        """False when there is no API key or the circuit breaker is open.
+
+        Always True while replaying recorded traffic, which needs neither.
+        """
+        if self.traffic.replaying:
+            return True
+        return bool(self.api_url) and not gemini_http.breaker.is_open()
+
+    def _fell_back(self, task: str, reason: str):
+        """Record that ``task`` was answered locally instead of by Gemini."""
+        metrics.record_fallback(task, reason)
+        deadline.degrade(task, reason)
+
+    def _skip_llm(self, task: str) -> bool:
+        """True when ``task`` should go straight to its local fallback.
+
+        That is the case when the API is unavailable or when the turn's
+        deadline leaves less than ``deadline_min_call`` seconds for the call.
+        """
+        if not self._api_available():
+            self._fell_back(task, 'unavailable')
+            return True
+        if deadline.remaining(self.deadline_min_call) < self.deadline_min_call:
+            self._fell_back(task, 'deadline')
+            return True
+        return False
+
+    def _call_cancelled(self) -> bool:
+        """True when the concurrent call running on this thread was abandoned
+        or the turn it belongs to ran out of time."""
+        cancel_event = getattr(self._call_state, 'cancel_event', None)
+        if cancel_event is not None and cancel_event.is_set():
+            return True
+        current = deadline.current()
+        return current is not None and current.expired()
+
+    def _run_cancellable(self, cancel_event: threading.Event, turn_deadline, func, args):
+        self._call_state.cancel_event = cancel_event
+        try:
+            with deadline.activate(turn_deadline):
+                return func(*args)
+        finally:
+            self._call_state.cancel_event = None
+
+    def submit(self, func, *args, cancel_event: threading.Event = None) -> Future:
+        """Start one LLM call on the shared executor under the turn's deadline.
+
+        Setting ``cancel_event`` tells the call, once running, to stop
+        before its next retry; Future.cancel() only helps while it queues.
+        """
+        return self.executor.submit(self._run_cancellable, cancel_event or threading.Event(), deadline.current(), func, args)
+
     def extract_features(self, text: str) -> Dict:
         """Extract product features from user query."""
-        if not self.api_url:
+        if self._skip_llm('parse'):
             return self._fallback_parse_query(text)
         
-        prompt = self.parsing_prompt + f"\n\nUser query: {text}"
+        _, prompt = self.prompts.build('parse', message=text)
         
         try:
-            response_text = self._make_api_request(prompt)
-            if response_text:
-                # Extract JSON from response
-                match = re.search(r'\{[\s\S]*\}', response_text)
-                if match:
-                    features = json.loads(match.group())
-                    return features
+            response_text = self._cached_api_request('parse', prompt, text, validate=SearchFilters.is_valid,
+                                                     response_schema=SearchFilters.SCHEMA)
+            features = self._parse_structured('parse', response_text, SearchFilters)
+            if features is not None:
+                return features.to_dict()
         except Exception as e:
             print(f"Error extracting features: {str(e)}")
         
+        self._fell_back('parse', 'failed')
         return self._fallback_parse_query(text)
 
     def get_product_recommendations(self, features: Dict, products: List[Dict], limit: int = 5) -> List[Dict]:
@@ -234,100 +701,193 @@ If not electronics-related, return: {}"""
         scored_products.sort(reverse=True, key=lambda x: x[0])
         return [product for _, product in scored_products[:limit]]
 
+    def _build_response_prompt(self, query: str, products: List[Dict], conversation_history: List[Dict] = None):
+        """(system, body) for the conversational reply prompt."""
+        context = ""
+        if conversation_history:
+            # Last 4 messages for context
+            context = "\n\nRECENT CONVERSATION:\n" + self.prompts.format_history(conversation_history, 4)
+        product_info = self.prompts.format_products(
+            products, "AVAILABLE PRODUCTS", "NO MATCHING PRODUCTS FOUND in our electronics inventory."
+        )
+        return self.prompts.build('respond', query=query, context=context, product_info=product_info)
+
     def generate_response(self, query: str, products: List[Dict], conversation_history: List[Dict] = None) -> str:
         """Generate a natural, conversational response based on the query and matching products."""
-        if not self.api_url:
-            return "I apologize, but I'm unable to process your request right now. Please try again later!"
+        if self._skip_llm('respond'):
+            return self.UNAVAILABLE_REPLY
 
         try:
-            # Prepare conversation context
-            context = ""
-            if conversation_history:
-                recent_history = conversation_history[-4:]  # Last 4 messages for context
-                context = "\n\nRECENT CONVERSATION:\n"
-                for msg in recent_history:
-                    role = "Customer" if not msg.get('is_bot') else "Alex"
-                    context += f"{role}: {msg['message']}\n"
-
-            # Prepare product information
-            if products:
-                product_info = "\n\nAVAILABLE PRODUCTS:\n"
-                for i, product in enumerate(products[:5], 1):  # Top 5 products
-                    product_info += f"{i}. {product['name']} - ${product['price']:.2f}\n"
-                    product_info += f"   Category: {product['category']}, Style: {product.get('style', 'N/A')}\n"
-                    product_info += f"   Rating: {product.get('rating', 0):.1f}/5, Stock: {product.get('stock_quantity', 0)}\n"
-                    if product.get('description'):
-                        product_info += f"   Description: {product['description'][:100]}...\n"
-                    product_info += "\n"
+            system, conversation_prompt = self._build_response_prompt(query, products, conversation_history)
+            response_text = self._cached_api_request(
+                'respond', conversation_prompt, query,
+                products=products[:5], history=conversation_history, history_limit=4,
+                system=system
+            )
+            if response_text:
+                return response_text.strip()
             else:
-                product_info = "\n\nNO MATCHING PRODUCTS FOUND in our electronics inventory."
+                self._fell_back('respond', 'failed')
+                return self.DEFAULT_REPLY
 
-            # Create conversational prompt
-            conversation_prompt = f"""{self.system_prompt}
-
-CURRENT SITUATION:
-Customer Query: "{query}"
-{context}
-{product_info}
-
-TASK: Respond as Alex, the friendly electronics sales assistant. Make your response natural and conversational:
-
-1. If products are available:
-   - Acknowledge their request warmly
-   - Recommend 2-3 best products with specific reasons why they're good fits
-   - Mention key features that matter for their use case
-   - Include prices naturally in conversation
-   - Ask a follow-up question to help them choose or learn more about their needs
-
-2. If no products found:
-   - Acknowledge what they're looking for
-   - Explain why no matches were found (but stay positive)
-   - Suggest similar alternatives or ask clarifying questions
-   - Offer to help them find something else
+        except Exception as e:
+            print(f"Error generating response: {str(e)}")
+            self._fell_back('respond', 'failed')
+            return self.DEFAULT_REPLY
 
-3. If query is unclear:
-   - Ask friendly clarifying questions
-   - Suggest specific examples
-   - Show enthusiasm to help
+    def stream_response(self, query: str, products: List[Dict], conversation_history: List[Dict] = None):
+        """Yield the reply to a query in chunks as Gemini produces them.
 
-STYLE: Be conversational, helpful, and enthusiastic. Avoid robotic or template-like responses."""
+        A cached reply is yielded in one piece. If the stream fails before
+        any text arrives, the default reply is yielded instead, so callers
+        always receive a complete message. Only a stream that ran to its end
+        is cached; one cut off partway is reported as degraded.
+        """
+        if self._skip_llm('respond'):
+            yield self.UNAVAILABLE_REPLY
+            return
 
-            response_text = self._make_api_request(conversation_prompt)
-            if response_text:
-                return response_text.strip()
-            else:
-                return "Hi there! I'm Alex from NexTechAI, and I'm here to help you discover amazing technology solutions! 🚀 Could you tell me what kind of premium electronics you're looking for? Whether it's laptops, smartphones, gaming gear, or audio equipment - I'll find the perfect NexTechAI products for you!"
+        product_ids = [p.get('id') for p in products[:5]] if products else None
+        key = self.cache.make_key('respond', query, product_ids, conversation_history, 4)
+        cached = self.cache.get('respond', key)
+        if cached is not None:
+            yield cached.strip()
+            return
 
+        chunks = []
+        finished = False
+        try:
+            system, prompt = self._build_response_prompt(query, products, conversation_history)
+            stream = self._stream_api_request(prompt, system=system)
+            while True:
+                try:
+                    chunk = next(stream)
+                except StopIteration as stop:
+                    finished = bool(stop.value)
+                    break
+                chunks.append(chunk)
+                yield chunk
         except Exception as e:
-            print(f"Error generating response: {str(e)}")
-            return "Hi there! I'm Alex from NexTechAI, and I'm here to help you discover amazing technology solutions! 🚀 Could you tell me what kind of premium electronics you're looking for? Whether it's laptops, smartphones, gaming gear, or audio equipment - I'll find the perfect NexTechAI products for you!"
+            print(f"Error streaming response: {str(e)}")
+
+        if not chunks:
+            self._fell_back('respond', 'failed')
+            yield self.DEFAULT_REPLY
+        elif finished:
+            self.cache.set('respond', key, ''.join(chunks))
+        else:
+            print("Response stream ended early, not caching the partial reply")
+            self._fell_back('respond', 'failed')
 
     def parse_query(self, user_message: str) -> Dict:
-        """Parse user query and extract relevant product filters."""
-        if not self.api_url:
-            return self._fallback_parse_query(user_message)
-            
+        """Parse user query and extract relevant product filters.
+
+        Filters depend only on the text, so results are memoized on the
+        canonical form of the message and repeats skip the LLM. The memo
+        and the response cache still answer while calls are being skipped
+        (breaker open, deadline short); only a miss falls back to keywords.
+        """
         try:
-            prompt = f"{self.parsing_prompt}\n\nUser query: {user_message}"
-            response_text = self._make_api_request(prompt)
-            
-            if response_text:
-                start = response_text.find('{')
-                end = response_text.rfind('}') + 1
-                
-                if start >= 0 and end > start:
-                    return json.loads(response_text[start:end])
+            canonical = canonicalize(user_message)
+            memoized = self.parse_memo.get(canonical)
+            if memoized is not None:
+                return memoized
+
+            cached = self.cache.get('parse', self._cache_key('parse', user_message))
+            parsed = self._parse_structured('parse', cached, SearchFilters)
+            if parsed is None:
+                if self._skip_llm('parse'):
+                    return self._fallback_parse_query(user_message)
+                _, prompt = self.prompts.build('parse', message=user_message)
+                response_text = self._cached_api_request('parse', prompt, user_message, validate=SearchFilters.is_valid,
+                                                         response_schema=SearchFilters.SCHEMA)
+                parsed = self._parse_structured('parse', response_text, SearchFilters)
+            if parsed is not None:
+                filters = parsed.to_dict()
+                self.parse_memo.set(canonical, filters)
+                return filters
             
+            self._fell_back('parse', 'failed')
             return self._fallback_parse_query(user_message)
                     
         except Exception as e:
             print(f"Error in parse_query: {str(e)}")
+            self._fell_back('parse', 'failed')
             return self._fallback_parse_query(user_message)
 
+    def process_turn(self, user_message: str, products: List[Dict], conversation_history: List[Dict] = None) -> Dict:
+        """Answer a whole chat turn with a single structured Gemini call.
+
+        Returns the intent analysis, search filters, reply text and follow-up
+        suggestions that the multi-call path gets from handle_conversation,
+        parse_query, generate_response and generate_suggestions.
+        """
+        if self._skip_llm('turn'):
+            return self._fallback_turn(user_message)
+
+        try:
+            context = ""
+            if conversation_history:
+                context = "\n\nRECENT CONVERSATION:\n" + self.prompts.format_history(conversation_history, 6)
+            product_info = self.prompts.format_products(
+                products, "CANDIDATE PRODUCTS", "NO CANDIDATE PRODUCTS FOUND in our electronics inventory."
+            )
+            system, turn_prompt = self.prompts.build('turn', query=user_message, context=context, product_info=product_info)
+
+            response_text = self._cached_api_request(
+                'turn', turn_prompt, user_message,
+                products=products[:5], history=conversation_history, history_limit=6,
+                validate=TurnResult.is_valid, system=system, response_schema=TurnResult.SCHEMA
+            )
+            turn = self._parse_structured('turn', response_text, TurnResult)
+            if turn is not None:
+                self.intent_classifier.record('llm')
+                return turn.to_dict()
+        except Exception as e:
+            print(f"Error in process_turn: {str(e)}")
+
+        self.intent_classifier.record('fallback')
+        self._fell_back('turn', 'failed')
+        return self._fallback_turn(user_message)
+
+    def local_turn(self, user_message: str, conversation_history: List[Dict] = None) -> Optional[Dict]:
+        """A turn result for greetings and thank-yous the local classifier is
+        confident about, answered without Gemini; None when the turn needs
+        the model, service questions included."""
+        analysis, confidence = self.intent_classifier.classify(user_message, conversation_history)
+        if confidence < self.intent_classifier.threshold:
+            return None
+        if analysis['intent'] == 'greeting':
+            reply = self.DEFAULT_REPLY
+        elif self.intent_classifier.is_thanks(user_message):
+            reply = self.THANKS_REPLY
+        else:
+            return None
+        self.intent_classifier.record('local')
+        return {'analysis': analysis, 'filters': {}, 'reply': reply, 'suggestions': []}
+
+    def _fallback_turn(self, user_message: str) -> Dict:
+        """Keyword-based turn result for when the fused call is unavailable.
+
+        Suggestions are left empty so the caller can pick the static list
+        that matches the branch it ends up in.
+        """
+        return {
+            'analysis': self._fallback_conversation(user_message),
+            'filters': self._fallback_parse_query(user_message),
+            'reply': self.DEFAULT_REPLY,
+            'suggestions': []
+        }
+
+    def keyword_filters(self, user_message: str) -> Dict:
+        """Cheap keyword-only filters, used to prefetch candidate products."""
+        return self._fallback_parse_query(user_message)
+
     def _fallback_parse_query(self, user_message: str) -> Dict:
         """Simple keyword-based fallback for when Gemini is unavailable."""
         filters = {}
-        message = user_message.lower()
+        # "under $1k" and "under 1,000" both become "under 1000"
+        message = normalize_prices(user_message.lower())
         
         # Use case mapping
         use_cases = {
@@ -405,170 +965,110 @@ STYLE: Be conversational, helpful, and enthusiastic. Avoid robotic or template-l
         return filters
 
     def handle_conversation(self, user_message: str, conversation_history: List[Dict] = None) -> Dict:
-        """Handle different types of conversations intelligently."""
-        if not self.api_url:
-            return self._fallback_conversation(user_message)
+        """Handle different types of conversations intelligently.
+
+        Clear-cut messages are answered by the local classifier; only the
+        ambiguous ones are sent to Gemini.
+        """
+        analysis, confidence = self.intent_classifier.classify(user_message, conversation_history)
+        if confidence >= self.intent_classifier.threshold:
+            self.intent_classifier.record('local')
+            return analysis
+        if self._skip_llm('intent'):
+            self.intent_classifier.record('fallback')
+            return analysis
 
         try:
             # Analyze conversation intent
-            intent_prompt = f"""{self.system_prompt}
-
-CONVERSATION HISTORY:
-{self._format_conversation_history(conversation_history) if conversation_history else "No previous conversation"}
-
-CURRENT MESSAGE: "{user_message}"
-
-TASK: Analyze this conversation and determine:
-1. Intent: product_search, greeting, question, comparison, complaint, other
-2. Urgency: high, medium, low
-3. Sentiment: positive, neutral, negative
-4. Needs_products: true/false
-5. Follow_up_needed: true/false
-
-Return JSON:
-{{
-    "intent": "string",
-    "urgency": "string", 
-    "sentiment": "string",
-    "needs_products": boolean,
-    "follow_up_needed": boolean,
-    "response_type": "product_recommendation|general_help|clarification|greeting"
-}}"""
-
-            response_text = self._make_api_request(intent_prompt)
-            
-            if response_text:
-                # Extract JSON
-                match = re.search(r'\{[\s\S]*\}', response_text)
-                if match:
-                    analysis = json.loads(match.group())
-                    return analysis
-            
-            return self._fallback_conversation(user_message)
+            system, intent_prompt = self.prompts.build(
+                'intent',
+                history=self._format_conversation_history(conversation_history) if conversation_history else "No previous conversation",
+                message=user_message
+            )
+
+            response_text = self._cached_api_request(
+                'intent', intent_prompt, user_message,
+                history=conversation_history, history_limit=6,
+                validate=IntentAnalysis.is_valid, system=system, response_schema=IntentAnalysis.SCHEMA
+            )
+            llm_analysis = self._parse_structured('intent', response_text, IntentAnalysis)
+            if llm_analysis is not None:
+                self.intent_classifier.record('llm')
+                return llm_analysis.to_dict()
             
         except Exception as e:
             print(f"Error in conversation analysis: {str(e)}")
-            return self._fallback_conversation(user_message)
+
+        self.intent_classifier.record('fallback')
+        self._fell_back('intent', 'failed')
+        return analysis
 
     def _format_conversation_history(self, history: List[Dict]) -> str:
         """Format conversation history for AI context."""
-        if not history:
-            return ""
-        
-        formatted = ""
-        for msg in history[-6:]:  # Last 6 messages
-            role = "Customer" if not msg.get('is_bot') else "Alex"
-            formatted += f"{role}: {msg['message']}\n"
-        return formatted
+        # Last 6 messages
+        return self.prompts.format_history(history, 6)
 
     def _fallback_conversation(self, user_message: str) -> Dict:
         """Fallback conversation analysis when AI is unavailable."""
-        message_lower = user_message.lower()
-        
-        # Simple intent detection
-        if any(word in message_lower for word in ['hello', 'hi', 'hey', 'good morning', 'good afternoon']):
-            intent = "greeting"
-            response_type = "greeting"
-        elif any(word in message_lower for word in ['?', 'how', 'what', 'why', 'when', 'where']):
-            intent = "question"
-            response_type = "general_help"
-        elif any(word in message_lower for word in ['show', 'find', 'looking for', 'need', 'want', 'search']):
-            intent = "product_search"
-            response_type = "product_recommendation"
-        else:
-            intent = "other"
-            response_type = "clarification"
-        
-        return {
-            "intent": intent,
-            "urgency": "medium",
-            "sentiment": "neutral",
-            "needs_products": intent == "product_search",
-            "follow_up_needed": True,
-            "response_type": response_type
-        }
+        analysis, _ = self.intent_classifier.classify(user_message)
+        return analysis
+
+    def generate_suggestions(self, query: str, products: List[Dict], conversation_type: str,
+                             filters: Dict = None) -> List[str]:
+        """Generate smart follow-up suggestions based on the current context.
+
+        The precomputed suggestion bank answers whenever it has an entry for
+        this result shape; Gemini is only asked when it does not.
+        """
+        banked = self.suggestion_bank.match(conversation_type, products, filters)
+        if banked:
+            return banked
 
-    def generate_suggestions(self, query: str, products: List[Dict], conversation_type: str) -> List[str]:
-        """Generate smart follow-up suggestions based on the current context."""
         try:
-            suggestions_prompt = f"""
-As Alex, an electronics shopping assistant, generate 6 helpful follow-up questions/suggestions based on this conversation context:
-
-Customer Query: "{query}"
-Conversation Type: {conversation_type}
-Products Found: {len(products) if products else 0}
-
-Product Categories: {list(set([p.get('category', '') for p in products])) if products else []}
-
-Generate suggestions that would naturally follow this conversation. Make them:
-1. Contextually relevant
-2. Action-oriented
-3. Helpful for decision making
-4. Varied in scope (specific product questions, comparisons, alternatives, etc.)
-
-Return ONLY 6 suggestions, one per line, without numbering or bullets.
-Examples of good suggestions:
-- "Tell me more about the first product"
-- "Which has the best battery life?"
-- "Show me budget alternatives under $200"
-- "Any wireless options available?"
-- "What's the difference between these models?"
-- "Which would you recommend for a student?"
-"""
-
-            if not self.api_url:
+            _, suggestions_prompt = self.prompts.build(
+                'suggest',
+                query=query,
+                conversation_type=conversation_type,
+                product_count=len(products) if products else 0,
+                categories=list(set([p.get('category', '') for p in products])) if products else []
+            )
+
+            if self._skip_llm('suggest'):
                 # Fallback suggestions
-                return self._fallback_suggestions(conversation_type, products)
+                return self._fallback_suggestions(conversation_type, products, filters)
             
-            response_text = self._make_api_request(suggestions_prompt)
+            categories = sorted(set(p.get('category', '') for p in products)) if products else []
+            response_text = self._cached_api_request(
+                'suggest', suggestions_prompt, query,
+                extra=f"{conversation_type}|{len(products) if products else 0}|{','.join(categories)}"
+            )
             if response_text:
                 suggestions = [s.strip() for s in response_text.strip().split('\n') if s.strip()]
                 return suggestions[:6]  # Limit to 6 suggestions
             else:
-                return self._fallback_suggestions(conversation_type, products)
+                self._fell_back('suggest', 'failed')
+                return self._fallback_suggestions(conversation_type, products, filters)
 
         except Exception as e:
             print(f"Error generating suggestions: {str(e)}")
-            return self._fallback_suggestions(conversation_type, products)
+            self._fell_back('suggest', 'failed')
+            return self._fallback_suggestions(conversation_type, products, filters)
 
-    def _fallback_suggestions(self, conversation_type: str, products: List[Dict]) -> List[str]:
+    def _fallback_suggestions(self, conversation_type: str, products: List[Dict], filters: Dict = None) -> List[str]:
         """Fallback suggestions when API is not available."""
-        base_suggestions = [
-            "Show me more options",
-            "What's your best recommendation?",
-            "Any budget alternatives?",
-            "Tell me about the warranties",
-            "Show me customer reviews",
-            "Compare top 3 products"
-        ]
-        
-        if conversation_type == 'product_recommendation' and products:
-            if any('smartphone' in str(p.get('category', '')).lower() for p in products):
-                return [
-                    "Which has the best camera?",
-                    "Show me phones with long battery life",
-                    "Any 5G compatible models?",
-                    "What about storage options?",
-                    "Which is best for gaming?",
-                    "Show me budget alternatives"
-                ]
-            elif any('audio' in str(p.get('category', '')).lower() for p in products):
-                return [
-                    "Which has the best sound quality?",
-                    "Any noise-canceling options?",
-                    "Show me wireless models",
-                    "What about battery life?",
-                    "Which is most comfortable?",
-                    "Any budget alternatives?"
-                ]
-            elif any('laptop' in str(p.get('category', '')).lower() for p in products):
-                return [
-                    "Which is best for gaming?",
-                    "Show me lightweight options",
-                    "Any 2-in-1 convertibles?",
-                    "What about battery life?",
-                    "Which has the best display?",
-                    "Show me budget alternatives"
-                ]
-        
-        return base_suggestions
+        return self.suggestion_bank.lookup(conversation_type, products, filters)
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_gemini_service() -> GeminiService:
+    """Process-wide GeminiService, created on first use rather than at import."""
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = GeminiService()
+                _service.start_health_probe()
+    return _service
@@ -0,0 +1,135 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Optional
+
+import requests
+
+from .llm_metrics import metrics
+
+
+class HedgePolicy:
+    """Decides when to send a duplicate ("hedged") Gemini request.
+
+    Latencies of successful requests are kept per task in a rolling window.
+    Once a task has ``min_samples`` of them, a request that has not been
+    answered after the ``percentile`` latency of its window (but at least
+    ``min_delay`` seconds) gets a second copy sent; whichever answers first
+    is used. At most ``budget_per_minute`` copies go out per rolling minute,
+    so hedging cannot more than marginally raise quota spend.
+    """
+
+    def __init__(self, enabled: bool = False, percentile: float = 95, min_samples: int = 20,
+                 min_delay: float = 0.5, budget_per_minute: int = 30, window: int = 200,
+                 max_workers: int = 16):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.budget_per_minute = budget_per_minute
+        self.window = window
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._latencies = {}
+        self._hedge_times = deque()
+        self._executor = None
+
+    def observe(self, task: str, seconds: float):
+        with self._lock:
+            self._latencies.setdefault(task, deque(maxlen=self.window)).append(seconds)
+
+    def hedge_delay(self, task: str) -> Optional[float]:
+        """Seconds to wait before hedging a ``task`` request, or None when
+        hedging is off or the task has too few samples yet."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            samples = sorted(self._latencies.get(task, ()))
+        if len(samples) < self.min_samples:
+            return None
+        index = min(len(samples) - 1, int(len(samples) * self.percentile / 100))
+        return max(self.min_delay, samples[index])
+
+    def _budget_used(self, now: float) -> int:
+        while self._hedge_times and now - self._hedge_times[0] >= 60:
+            self._hedge_times.popleft()
+        return len(self._hedge_times)
+
+    def _acquire(self, task: str) -> bool:
+        """Take one hedge from the per-minute budget."""
+        now = time.monotonic()
+        with self._lock:
+            if self._budget_used(now) >= self.budget_per_minute:
+                metrics.record_hedge(task, 'budget_exhausted')
+                return False
+            self._hedge_times.append(now)
+        metrics.record_hedge(task, 'sent')
+        return True
+
+    def _submit(self, func: Callable, *args):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='gemini-hedge')
+        return self._executor.submit(func, *args)
+
+    def post(self, task: str, send: Callable[[], requests.Response], time_left: float) -> requests.Response:
+        """Call ``send`` and, if it is still waiting after the task's hedge
+        delay, call it again; return the first 200 response, or the first
+        request's outcome when neither succeeds. No copy is sent when the
+        delay is unknown yet or beyond ``time_left``.
+
+        ``send`` must make a streamed request: the losing response is closed
+        without its body being downloaded. Requests cannot be aborted while
+        waiting for headers, so the loser still runs to completion in the
+        background, it just no longer holds anyone up.
+        """
+        def timed():
+            started = time.monotonic()
+            response = send()
+            if response.status_code == 200:
+                self.observe(task, time.monotonic() - started)
+            return response
+
+        delay = self.hedge_delay(task)
+        if delay is None or delay >= time_left:
+            return timed()
+
+        primary = self._submit(timed)
+        done, _ = wait([primary], timeout=delay)
+        if done or not self._acquire(task):
+            return primary.result()
+
+        hedge = self._submit(timed)
+        pending = {primary, hedge}
+        winner = None
+        while pending and winner is None:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None and future.result().status_code == 200:
+                    winner = future
+                    break
+
+        if winner is hedge:
+            metrics.record_hedge(task, 'won')
+        for future in (primary, hedge):
+            if future is not (winner or primary):
+                future.add_done_callback(_close_response)
+        return (winner or primary).result()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            tasks = list(self._latencies)
+            used = self._budget_used(time.monotonic())
+        return {
+            'enabled': self.enabled,
+            'percentile': self.percentile,
+            'budget_per_minute': self.budget_per_minute,
+            'budget_used': used,
+            'delays': {task: self.hedge_delay(task) for task in tasks}
+        }
+
+
+def _close_response(future):
+    if future.exception() is None:
+        future.result().close()
@@ -0,0 +1,119 @@
+import re
+import threading
+from typing import Dict, List, Tuple
+
+from .query_canonicalizer import canonicalize
+
+GREETING_WORDS = {'hi', 'hello', 'hey', 'hiya', 'howdy', 'yo', 'greetings', 'morning', 'afternoon', 'evening'}
+GREETING_FILLERS = {'good', 'there', 'alex', 'team', 'all', 'folks', 'again'}
+THANKS_WORDS = {'thanks', 'thank', 'thx', 'ty', 'cheers'}
+THANKS_FILLERS = {'you', 'so', 'much', 'a', 'lot', 'very', 'ok', 'okay', 'great', 'perfect', 'for', 'the', 'help'}
+
+PRODUCT_KEYWORDS = {
+    'headphone', 'headphones', 'speaker', 'speakers', 'earbud', 'earbuds', 'soundbar', 'microphone',
+    'airpods', 'earphones', 'headset', 'headsets', 'laptop', 'laptops', 'desktop', 'desktops', 'tablet',
+    'tablets', 'monitor', 'monitors', 'pc', 'computer', 'computers', 'macbook', 'phone', 'phones',
+    'iphone', 'android', 'mobile', 'smartphone', 'smartphones', 'console', 'consoles', 'controller',
+    'controllers', 'ps5', 'xbox', 'nintendo', 'playstation', 'charger', 'chargers', 'cable', 'cables',
+    'keyboard', 'keyboards', 'mouse', 'adapter', 'electronics', 'gadget', 'gadgets', 'watch', 'camera'
+}
+SEARCH_WORDS = {'show', 'find', 'need', 'want', 'looking', 'search', 'buy', 'recommend', 'suggest', 'get', 'best', 'cheap', 'budget'}
+SERVICE_WORDS = {'shipping', 'delivery', 'deliver', 'return', 'returns', 'refund', 'warranty', 'payment', 'pay',
+                 'order', 'orders', 'cancel', 'account', 'password', 'track', 'tracking', 'policy'}
+QUESTION_WORDS = {'how', 'what', 'why', 'when', 'where', 'who', 'which', 'can', 'do', 'does', 'is', 'are'}
+# Words that point back at earlier turns; without the history the local
+# tier cannot tell what they refer to
+REFERENCE_WORDS = {'it', 'that', 'this', 'those', 'these', 'them', 'one', 'first', 'second', 'third', 'last', 'other', 'same'}
+COMPLAINT_WORDS = {'broken', 'damaged', 'angry', 'terrible', 'worst', 'complaint', 'disappointed', 'wrong', 'late', 'never'}
+
+_PRICE = re.compile(r'\b(?:under|below|over|above|between|budget|max)\s+\d+|\d+\s*-\s*\d+')
+
+
+def _analysis(intent: str, response_type: str, sentiment: str = 'neutral') -> Dict:
+    return {
+        "intent": intent,
+        "urgency": "medium",
+        "sentiment": sentiment,
+        "needs_products": intent == "product_search",
+        "follow_up_needed": True,
+        "response_type": response_type
+    }
+
+
+def _is_thanks(word_set) -> bool:
+    return bool(word_set & THANKS_WORDS) and word_set <= THANKS_WORDS | THANKS_FILLERS | GREETING_FILLERS
+
+
+class IntentClassifier:
+    """Local first tier of intent classification.
+
+    ``classify`` scores a message against keyword sets in microseconds and
+    returns the analysis together with a confidence. Callers escalate to
+    the LLM when the confidence is below ``threshold``.
+    """
+
+    def __init__(self, threshold: float = 0.8):
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._counters = {'local': 0, 'llm': 0, 'fallback': 0}
+
+    def classify(self, message: str, conversation_history: List[Dict] = None) -> Tuple[Dict, float]:
+        text = canonicalize(message, strip_fillers=False)
+        words = text.split()
+        word_set = set(words)
+        if not words:
+            return _analysis('other', 'clarification'), 0.2
+
+        has_product = bool(word_set & PRODUCT_KEYWORDS)
+        has_search = bool(word_set & SEARCH_WORDS)
+        has_price = bool(_PRICE.search(text))
+        has_service = bool(word_set & SERVICE_WORDS)
+        is_question = message.strip().endswith('?') or words[0] in QUESTION_WORDS
+        refers_back = bool(conversation_history) and len(conversation_history) > 1 and bool(word_set & REFERENCE_WORDS)
+
+        if word_set & COMPLAINT_WORDS:
+            return _analysis('complaint', 'general_help', sentiment='negative'), 0.5
+
+        if word_set & GREETING_WORDS and word_set <= GREETING_WORDS | GREETING_FILLERS:
+            return _analysis('greeting', 'greeting', sentiment='positive'), 0.95
+
+        if _is_thanks(word_set):
+            return _analysis('other', 'general_help', sentiment='positive'), 0.9
+
+        if has_product and not has_service:
+            if refers_back:
+                confidence = 0.6
+            elif has_search or has_price or len(words) <= 4:
+                confidence = 0.9
+            else:
+                confidence = 0.75
+            return _analysis('product_search', 'product_recommendation'), confidence
+
+        if has_service and not has_product:
+            return _analysis('question', 'general_help'), 0.85 if not refers_back else 0.6
+
+        if is_question:
+            return _analysis('question', 'general_help'), 0.5
+
+        if has_search or has_price:
+            return _analysis('product_search', 'product_recommendation'), 0.55
+
+        return _analysis('other', 'clarification'), 0.3
+
+    @staticmethod
+    def is_thanks(message: str) -> bool:
+        """True when the message does nothing but say thank you."""
+        return _is_thanks(set(canonicalize(message, strip_fillers=False).split()))
+
+    def record(self, tier: str):
+        with self._lock:
+            self._counters[tier] = self._counters.get(tier, 0) + 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = sum(self._counters.values())
+            return {
+                'threshold': self.threshold,
+                'answered_by': dict(self._counters),
+                'local_rate': round(self._counters['local'] / total, 3) if total else 0.0
+            }
@@ -0,0 +1,158 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional
+
+# Seconds a cached Gemini response stays valid, per task. Override with
+# GEMINI_CACHE_TTLS="parse=7200,respond=60".
+DEFAULT_TTLS = {
+    'intent': 600,
+    'parse': 3600,
+    'respond': 300,
+    'suggest': 900,
+    'turn': 300
+}
+
+
+def _parse_ttls(raw: Optional[str]) -> Dict[str, float]:
+    ttls = dict(DEFAULT_TTLS)
+    for item in (raw or '').split(','):
+        if '=' not in item:
+            continue
+        task, seconds = item.split('=', 1)
+        try:
+            ttls[task.strip()] = float(seconds)
+        except ValueError:
+            print(f"Ignoring invalid cache TTL for {task.strip()}: {seconds}")
+    return ttls
+
+
+def normalize_message(message: str) -> str:
+    return ' '.join((message or '').lower().split())
+
+
+def trim_history(history: Optional[List[Dict]], limit: int) -> List:
+    """The part of the history a prompt actually uses, reduced to role and text."""
+    if not history:
+        return []
+    # A leading session summary is always part of the prompt
+    lead = history[:1] if history[0].get('is_summary') else []
+    recent = history[len(lead):][-limit:]
+    return [[bool(msg.get('is_bot')), normalize_message(msg.get('message', ''))] for msg in lead + recent]
+
+
+class ResponseCache:
+    """LRU + TTL cache for Gemini response text, keyed on prompt components.
+
+    Entries live in an in-process LRU table. When GEMINI_CACHE_REDIS is set
+    and REDIS_URL points at a reachable server, a shared Redis tier sits
+    behind it so workers and nodes can reuse each other's responses.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv('GEMINI_CACHE_ENABLED', 'true').lower() == 'true'
+        self.max_entries = int(os.getenv('GEMINI_CACHE_MAX_ENTRIES', '1024'))
+        self.ttls = _parse_ttls(os.getenv('GEMINI_CACHE_TTLS'))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {}
+        self._redis = None
+        if self.enabled and os.getenv('GEMINI_CACHE_REDIS', 'false').lower() == 'true':
+            self._redis = self._connect_redis(os.getenv('REDIS_URL'))
+
+    @staticmethod
+    def _connect_redis(url: Optional[str]):
+        if not url:
+            return None
+        try:
+            from redis import Redis
+            client = Redis.from_url(url, socket_timeout=0.2, socket_connect_timeout=0.2)
+            client.ping()
+            return client
+        except Exception as e:
+            print(f"Gemini response cache running without Redis: {e}")
+            return None
+
+    def make_key(self, task: str, message: str, product_ids: Iterable = None,
+                 history: Optional[List[Dict]] = None, history_limit: int = 0, extra: str = '') -> str:
+        components = [
+            task,
+            normalize_message(message),
+            sorted(str(pid) for pid in (product_ids or [])),
+            trim_history(history, history_limit) if history_limit else [],
+            extra
+        ]
+        digest = hashlib.sha256(json.dumps(components, ensure_ascii=False).encode('utf-8')).hexdigest()
+        return f"gemini:{task}:{digest}"
+
+    def _count(self, task: str, field: str):
+        task_stats = self._stats.setdefault(task, {'hits': 0, 'redis_hits': 0, 'misses': 0, 'stores': 0})
+        task_stats[field] += 1
+
+    def get(self, task: str, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._count(task, 'hits')
+                    return value
+                del self._entries[key]
+
+        if self._redis is not None:
+            try:
+                value = self._redis.get(key)
+            except Exception as e:
+                print(f"Redis cache read failed: {e}")
+                value = None
+            if value is not None:
+                value = value.decode('utf-8')
+                self._store_local(key, value, self.ttls.get(task, 300))
+                with self._lock:
+                    self._count(task, 'redis_hits')
+                return value
+
+        with self._lock:
+            self._count(task, 'misses')
+        return None
+
+    def _store_local(self, key: str, value: str, ttl: float):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def set(self, task: str, key: str, value: str):
+        ttl = self.ttls.get(task, 300)
+        if not self.enabled or not value or ttl <= 0:
+            return
+        self._store_local(key, value, ttl)
+        with self._lock:
+            self._count(task, 'stores')
+        if self._redis is not None:
+            try:
+                self._redis.setex(key, int(ttl), value)
+            except Exception as e:
+                print(f"Redis cache write failed: {e}")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            tasks = {}
+            for task, task_stats in self._stats.items():
+                lookups = task_stats['hits'] + task_stats['redis_hits'] + task_stats['misses']
+                tasks[task] = dict(task_stats, hit_rate=round((lookups - task_stats['misses']) / lookups, 3) if lookups else 0.0)
+            return {
+                'enabled': self.enabled,
+                'redis': self._redis is not None,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'tasks': tasks
+            }
@@ -0,0 +1,229 @@
+import bisect
+import threading
+from typing import Dict, List
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = [0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30]
+# Upper bounds, in seconds, of the concurrency-limiter queue wait buckets
+QUEUE_WAIT_BUCKETS = [0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5]
+# Upper bounds, in characters, of the prompt/response size histogram buckets
+SIZE_BUCKETS = [256, 1024, 4096, 16384, 65536]
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense."""
+
+    def __init__(self, buckets: List[float]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List:
+        """[(upper bound, count <= bound)], ending with ('+Inf', total)."""
+        result = []
+        running = 0
+        for bound, count in zip(self.buckets + ['+Inf'], self.counts):
+            running += count
+            result.append((bound, running))
+        return result
+
+    def snapshot(self) -> Dict:
+        return {
+            'count': self.count,
+            'sum': round(self.sum, 4),
+            'buckets': {str(bound): count for bound, count in self.cumulative()}
+        }
+
+
+class LLMMetrics:
+    """In-process registry of Gemini call telemetry, labelled by task.
+
+    Each gunicorn worker keeps its own registry; scrape every worker (or
+    sum across them) for a service-wide view.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latency = {}
+        self._prompt_chars = {}
+        self._response_chars = {}
+        self._statuses = {}
+        self._retries = {}
+        self._fallbacks = {}
+        self._speculative_searches = {}
+        self._hedges = {}
+        self._structured = {}
+        self._queue_wait = {}
+        self._queue_rejections = {}
+        self._queue_depth = {}
+        self._in_flight = {}
+
+    def observe_request(self, task: str, seconds: float, status, prompt_chars: int, response_chars: int = None):
+        """Record one HTTP attempt; ``status`` is the HTTP code or 'error'."""
+        with self._lock:
+            self._latency.setdefault(task, Histogram(LATENCY_BUCKETS)).observe(seconds)
+            self._prompt_chars.setdefault(task, Histogram(SIZE_BUCKETS)).observe(prompt_chars)
+            if response_chars is not None:
+                self._response_chars.setdefault(task, Histogram(SIZE_BUCKETS)).observe(response_chars)
+            key = (task, str(status))
+            self._statuses[key] = self._statuses.get(key, 0) + 1
+
+    def record_retry(self, task: str):
+        with self._lock:
+            self._retries[task] = self._retries.get(task, 0) + 1
+
+    def record_fallback(self, task: str, reason: str):
+        """Count an answer produced locally instead of by the LLM.
+
+        ``reason`` is 'unavailable' when the LLM was not tried (no key or
+        open breaker) and 'failed' when it was tried without a usable answer.
+        """
+        with self._lock:
+            key = (task, reason)
+            self._fallbacks[key] = self._fallbacks.get(key, 0) + 1
+
+    def record_hedge(self, task: str, outcome: str):
+        """Count a hedging decision: 'sent' when a duplicate request went
+        out, 'won' when it answered first and 'budget_exhausted' when the
+        per-minute budget ruled one out."""
+        with self._lock:
+            key = (task, outcome)
+            self._hedges[key] = self._hedges.get(key, 0) + 1
+
+    def observe_queue_wait(self, task: str, seconds: float, waiting: int, in_flight: int):
+        """Record how long a call waited for a concurrency slot, with the
+        queue depth and calls in flight right after."""
+        with self._lock:
+            self._queue_wait.setdefault(task, Histogram(QUEUE_WAIT_BUCKETS)).observe(seconds)
+            self._queue_depth[task] = waiting
+            self._in_flight[task] = in_flight
+
+    def set_concurrency(self, task: str, waiting: int, in_flight: int):
+        with self._lock:
+            self._queue_depth[task] = waiting
+            self._in_flight[task] = in_flight
+
+    def record_queue_rejection(self, task: str, reason: str):
+        """Count a call refused by the concurrency limiter ('queue_full' or
+        'queue_timeout'); the caller answers from its fallback instead."""
+        with self._lock:
+            key = (task, reason)
+            self._queue_rejections[key] = self._queue_rejections.get(key, 0) + 1
+
+    def record_structured_parse(self, task: str, outcome: str):
+        """Count a JSON response by how it parsed: 'ok', 'invalid_json' or
+        'schema_mismatch'. Every failure is a paid call thrown away."""
+        with self._lock:
+            key = (task, outcome)
+            self._structured[key] = self._structured.get(key, 0) + 1
+
+    def record_speculative_search(self, outcome: str):
+        """Count a catalog search started before the LLM parse returned.
+
+        ``outcome`` is 'hit' when the parsed filters matched the guessed
+        ones and the result was used, 'miss' when the search was redone.
+        """
+        with self._lock:
+            self._speculative_searches[outcome] = self._speculative_searches.get(outcome, 0) + 1
+
+    def speculative_searches(self) -> Dict:
+        with self._lock:
+            return dict(self._speculative_searches)
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            tasks = sorted(set(self._latency) | set(self._retries) | {task for task, _ in self._fallbacks}
+                           | {task for task, _ in self._hedges} | set(self._queue_wait)
+                           | {task for task, _ in self._structured})
+            result = {}
+            for task in tasks:
+                result[task] = {
+                    'latency_seconds': self._latency[task].snapshot() if task in self._latency else None,
+                    'prompt_chars': self._prompt_chars[task].snapshot() if task in self._prompt_chars else None,
+                    'response_chars': self._response_chars[task].snapshot() if task in self._response_chars else None,
+                    'statuses': {status: count for (name, status), count in self._statuses.items() if name == task},
+                    'retries': self._retries.get(task, 0),
+                    'fallbacks': {reason: count for (name, reason), count in self._fallbacks.items() if name == task},
+                    'hedges': {outcome: count for (name, outcome), count in self._hedges.items() if name == task},
+                    'structured_parses': {outcome: count for (name, outcome), count in self._structured.items() if name == task},
+                    'queue': {
+                        'wait_seconds': self._queue_wait[task].snapshot() if task in self._queue_wait else None,
+                        'depth': self._queue_depth.get(task, 0),
+                        'in_flight': self._in_flight.get(task, 0),
+                        'rejections': {reason: count for (name, reason), count in self._queue_rejections.items() if name == task}
+                    }
+                }
+            return result
+
+    def render_prometheus(self) -> str:
+        """The registry in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for name, help_text, histograms in (
+                ('gemini_request_duration_seconds', 'Latency of Gemini HTTP attempts', self._latency),
+                ('gemini_prompt_chars', 'Prompt size of Gemini requests in characters', self._prompt_chars),
+                ('gemini_response_chars', 'Response size of successful Gemini requests in characters', self._response_chars),
+                ('gemini_queue_wait_seconds', 'Time Gemini calls waited for a concurrency slot', self._queue_wait)
+            ):
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} histogram")
+                for task, histogram in sorted(histograms.items()):
+                    for bound, count in histogram.cumulative():
+                        lines.append(f'{name}_bucket{{task="{task}",le="{bound}"}} {count}')
+                    lines.append(f'{name}_sum{{task="{task}"}} {histogram.sum:.4f}')
+                    lines.append(f'{name}_count{{task="{task}"}} {histogram.count}')
+
+            lines.append("# HELP gemini_requests_total Gemini HTTP attempts by status code")
+            lines.append("# TYPE gemini_requests_total counter")
+            for (task, status), count in sorted(self._statuses.items()):
+                lines.append(f'gemini_requests_total{{task="{task}",status="{status}"}} {count}')
+
+            lines.append("# HELP gemini_retries_total Gemini attempts that were retries")
+            lines.append("# TYPE gemini_retries_total counter")
+            for task, count in sorted(self._retries.items()):
+                lines.append(f'gemini_retries_total{{task="{task}"}} {count}')
+
+            lines.append("# HELP gemini_fallbacks_total Answers produced locally instead of by Gemini")
+            lines.append("# TYPE gemini_fallbacks_total counter")
+            for (task, reason), count in sorted(self._fallbacks.items()):
+                lines.append(f'gemini_fallbacks_total{{task="{task}",reason="{reason}"}} {count}')
+
+            for name, help_text, gauges in (
+                ('gemini_queue_depth', 'Gemini calls waiting for a concurrency slot', self._queue_depth),
+                ('gemini_in_flight', 'Gemini calls holding a concurrency slot', self._in_flight)
+            ):
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} gauge")
+                for task, value in sorted(gauges.items()):
+                    lines.append(f'{name}{{task="{task}"}} {value}')
+
+            lines.append("# HELP gemini_queue_rejections_total Gemini calls refused by the concurrency limiter")
+            lines.append("# TYPE gemini_queue_rejections_total counter")
+            for (task, reason), count in sorted(self._queue_rejections.items()):
+                lines.append(f'gemini_queue_rejections_total{{task="{task}",reason="{reason}"}} {count}')
+
+            lines.append("# HELP gemini_structured_parses_total JSON responses by parse outcome")
+            lines.append("# TYPE gemini_structured_parses_total counter")
+            for (task, outcome), count in sorted(self._structured.items()):
+                lines.append(f'gemini_structured_parses_total{{task="{task}",outcome="{outcome}"}} {count}')
+
+            lines.append("# HELP gemini_hedges_total Duplicate Gemini requests sent to cut tail latency")
+            lines.append("# TYPE gemini_hedges_total counter")
+            for (task, outcome), count in sorted(self._hedges.items()):
+                lines.append(f'gemini_hedges_total{{task="{task}",outcome="{outcome}"}} {count}')
+
+            lines.append("# HELP chat_speculative_searches_total Catalog searches run while the LLM parse was in flight")
+            lines.append("# TYPE chat_speculative_searches_total counter")
+            for outcome, count in sorted(self._speculative_searches.items()):
+                lines.append(f'chat_speculative_searches_total{{outcome="{outcome}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+# Shared by every GeminiService in the process
+metrics = LLMMetrics()
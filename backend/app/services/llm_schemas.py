@@ -0,0 +1,256 @@
+import json
+from typing import Any, Dict, List, Optional
+
+# Response schemas sent to Gemini as generationConfig.responseSchema (the
+# OpenAPI subset it accepts). The same schemas validate what comes back.
+
+CATEGORIES = ['computers', 'smartphones', 'audio', 'gaming', 'accessories']
+STYLES = ['premium', 'budget', 'gaming', 'professional', 'casual', 'student']
+INTENTS = ['product_search', 'greeting', 'question', 'comparison', 'complaint', 'other']
+RESPONSE_TYPES = ['product_recommendation', 'general_help', 'clarification', 'greeting']
+
+
+def _enum(values: List[str], nullable: bool = False) -> Dict:
+    schema = {'type': 'STRING', 'format': 'enum', 'enum': values}
+    if nullable:
+        schema['nullable'] = True
+    return schema
+
+
+FILTERS_SCHEMA = {
+    'type': 'OBJECT',
+    'properties': {
+        'category': _enum(CATEGORIES, nullable=True),
+        'subcategory': {'type': 'STRING', 'nullable': True},
+        'style': _enum(STYLES, nullable=True),
+        'color': {'type': 'STRING', 'nullable': True},
+        'storage': {'type': 'STRING', 'nullable': True},
+        'price_range': {
+            'type': 'OBJECT',
+            'nullable': True,
+            'properties': {
+                'min': {'type': 'NUMBER', 'nullable': True},
+                'max': {'type': 'NUMBER', 'nullable': True}
+            }
+        }
+    }
+}
+
+INTENT_PROPERTIES = {
+    'intent': _enum(INTENTS),
+    'urgency': _enum(['high', 'medium', 'low']),
+    'sentiment': _enum(['positive', 'neutral', 'negative']),
+    'needs_products': {'type': 'BOOLEAN'},
+    'follow_up_needed': {'type': 'BOOLEAN'},
+    'response_type': _enum(RESPONSE_TYPES)
+}
+
+INTENT_SCHEMA = {
+    'type': 'OBJECT',
+    'properties': INTENT_PROPERTIES,
+    'required': list(INTENT_PROPERTIES)
+}
+
+TURN_SCHEMA = {
+    'type': 'OBJECT',
+    'properties': dict(
+        INTENT_PROPERTIES,
+        filters=FILTERS_SCHEMA,
+        reply={'type': 'STRING'},
+        suggestions={'type': 'ARRAY', 'items': {'type': 'STRING'}}
+    ),
+    'required': list(INTENT_PROPERTIES) + ['reply']
+}
+
+
+class SchemaError(ValueError):
+    """A response that is not JSON or does not match its schema.
+
+    ``reason`` is 'invalid_json' or 'schema_mismatch'.
+    """
+
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason
+
+
+def _drop_empty(value):
+    # Models often spell "unknown" as null or ""; treat both as absent
+    if isinstance(value, dict):
+        return {key: _drop_empty(item) for key, item in value.items() if item is not None and item != ''}
+    if isinstance(value, list):
+        return [_drop_empty(item) for item in value]
+    return value
+
+
+def validate(value: Any, schema: Dict, path: str = '$'):
+    """Raise SchemaError unless ``value`` matches ``schema``."""
+    kind = schema['type']
+    if value is None:
+        if schema.get('nullable'):
+            return
+        raise SchemaError('schema_mismatch', f"{path} is null")
+    if kind == 'OBJECT':
+        if not isinstance(value, dict):
+            raise SchemaError('schema_mismatch', f"{path} is not an object")
+        for key in schema.get('required', []):
+            if key not in value:
+                raise SchemaError('schema_mismatch', f"{path}.{key} is missing")
+        for key, item in value.items():
+            if key in schema.get('properties', {}):
+                validate(item, schema['properties'][key], f"{path}.{key}")
+    elif kind == 'ARRAY':
+        if not isinstance(value, list):
+            raise SchemaError('schema_mismatch', f"{path} is not an array")
+        for index, item in enumerate(value):
+            validate(item, schema['items'], f"{path}[{index}]")
+    elif kind == 'STRING':
+        if not isinstance(value, str):
+            raise SchemaError('schema_mismatch', f"{path} is not a string")
+        if 'enum' in schema and value not in schema['enum']:
+            raise SchemaError('schema_mismatch', f"{path} is {value!r}, not one of {schema['enum']}")
+    elif kind == 'NUMBER':
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise SchemaError('schema_mismatch', f"{path} is not a number")
+    elif kind == 'BOOLEAN':
+        if not isinstance(value, bool):
+            raise SchemaError('schema_mismatch', f"{path} is not a boolean")
+
+
+def parse_json_object(text: str) -> Dict:
+    """The JSON object in a response.
+
+    Structured responses are bare JSON; for models that wrap it in prose or
+    a code fence, the outermost braces are tried as well.
+    """
+    text = (text or '').strip()
+    try:
+        data = json.loads(text)
+    except ValueError:
+        start = text.find('{')
+        end = text.rfind('}') + 1
+        try:
+            data = json.loads(text[start:end]) if start >= 0 and end > start else None
+        except ValueError:
+            data = None
+    if not isinstance(data, dict):
+        raise SchemaError('invalid_json', 'response is not a JSON object')
+    return data
+
+
+class _Structured:
+    SCHEMA = None
+
+    @classmethod
+    def from_text(cls, text: str):
+        data = _drop_empty(parse_json_object(text))
+        validate(data, cls.SCHEMA)
+        return cls.from_dict(data)
+
+    @classmethod
+    def is_valid(cls, text: str) -> bool:
+        try:
+            cls.from_text(text)
+            return True
+        except SchemaError:
+            return False
+
+
+class SearchFilters(_Structured):
+    """Product search filters extracted from a message."""
+
+    SCHEMA = FILTERS_SCHEMA
+
+    def __init__(self, category: str = None, subcategory: str = None, style: str = None, color: str = None,
+                 storage: str = None, price_min: float = None, price_max: float = None):
+        self.category = category
+        self.subcategory = subcategory
+        self.style = style
+        self.color = color
+        self.storage = storage
+        self.price_min = price_min
+        self.price_max = price_max
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'SearchFilters':
+        price_range = data.get('price_range') or {}
+        return cls(
+            category=data.get('category'),
+            subcategory=data.get('subcategory'),
+            style=data.get('style'),
+            color=data.get('color'),
+            storage=data.get('storage'),
+            price_min=price_range.get('min'),
+            price_max=price_range.get('max')
+        )
+
+    def to_dict(self) -> Dict:
+        """The filters dict the catalog search reads; unset fields are left out."""
+        filters = {}
+        for field in ('category', 'subcategory', 'style', 'color', 'storage'):
+            if getattr(self, field) is not None:
+                filters[field] = getattr(self, field)
+        if self.price_min is not None or self.price_max is not None:
+            filters['price_range'] = {'min': self.price_min, 'max': self.price_max}
+        return filters
+
+
+class IntentAnalysis(_Structured):
+    """What a message wants and how the reply should be shaped."""
+
+    SCHEMA = INTENT_SCHEMA
+
+    def __init__(self, intent: str, urgency: str, sentiment: str, needs_products: bool,
+                 follow_up_needed: bool, response_type: str):
+        self.intent = intent
+        self.urgency = urgency
+        self.sentiment = sentiment
+        self.needs_products = needs_products
+        self.follow_up_needed = follow_up_needed
+        self.response_type = response_type
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'IntentAnalysis':
+        return cls(**{field: data[field] for field in INTENT_PROPERTIES})
+
+    def to_dict(self) -> Dict:
+        return {field: getattr(self, field) for field in INTENT_PROPERTIES}
+
+
+class TurnResult(_Structured):
+    """Everything the fused single-call turn returns."""
+
+    SCHEMA = TURN_SCHEMA
+
+    def __init__(self, analysis: IntentAnalysis, filters: SearchFilters, reply: str, suggestions: List[str]):
+        self.analysis = analysis
+        self.filters = filters
+        self.reply = reply
+        self.suggestions = suggestions
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'TurnResult':
+        reply = data['reply'].strip()
+        if not reply:
+            raise SchemaError('schema_mismatch', '$.reply is empty')
+        return cls(
+            analysis=IntentAnalysis.from_dict(data),
+            filters=SearchFilters.from_dict(data.get('filters') or {}),
+            reply=reply,
+            suggestions=[s.strip() for s in data.get('suggestions', []) if s.strip()][:6]
+        )
+
+    def to_dict(self) -> Dict:
+        return {
+            'analysis': self.analysis.to_dict(),
+            'filters': self.filters.to_dict(),
+            'reply': self.reply,
+            'suggestions': self.suggestions
+        }
+
+
+def structured_output(schema: Optional[Dict]) -> Optional[Dict]:
+    """generationConfig asking Gemini for JSON matching ``schema``."""
+    if schema is None:
+        return None
+    return {'responseMimeType': 'application/json', 'responseSchema': schema}
@@ -0,0 +1,170 @@
+import atexit
+import glob
+import gzip
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .single_flight import make_key
+
+MODES = ('off', 'record', 'replay')
+
+
+def _open(path: str, mode: str):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+class TrafficLog:
+    """Records Gemini traffic to disk and serves it back.
+
+    In ``record`` mode every call that reaches the API is appended to a
+    JSON-lines log (gzip-compressed when the path ends in ``.gz``) as the
+    hash of its task and prompt, the response text and the latency the
+    caller saw; streams also keep per-chunk offsets. A ``{pid}`` in the
+    path gives each worker its own file.
+
+    In ``replay`` mode no request leaves the process: calls are answered
+    from the logs matching the path glob after sleeping for the recorded
+    latency times ``latency_scale``. Prompts that were never recorded
+    count as misses and get no response, so callers take their fallbacks.
+    """
+
+    def __init__(self, mode: str = 'off', path: Optional[str] = None, latency_scale: float = 1.0):
+        if mode not in MODES:
+            print(f"Unknown Gemini traffic mode {mode!r}, not recording")
+            mode = 'off'
+        if mode != 'off' and not path:
+            print(f"Gemini traffic {mode} needs GEMINI_TRAFFIC_LOG, not recording")
+            mode = 'off'
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self._lock = threading.Lock()
+        self._counters = {'recorded': 0, 'replayed': 0, 'misses': 0}
+        self._entries = {}
+        self._file = None
+        self.path = None
+        if mode == 'record':
+            self.path = path.replace('{pid}', str(os.getpid()))
+        elif mode == 'replay':
+            self.path = path
+            self._load(path)
+
+    @property
+    def recording(self) -> bool:
+        return self.mode == 'record'
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == 'replay'
+
+    def _load(self, pattern: str):
+        files = sorted(glob.glob(pattern.replace('{pid}', '*')))
+        if not files:
+            print(f"No Gemini traffic logs match {pattern}; every call will miss")
+        for path in files:
+            with _open(path, 'r') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    self._entries.setdefault(entry['k'], deque()).append(entry)
+        print(f"Replaying {sum(len(entries) for entries in self._entries.values())} recorded Gemini calls from {len(files)} file(s)")
+
+    def _append(self, entry: Dict):
+        line = json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n'
+        with self._lock:
+            try:
+                if self._file is None:
+                    self._file = _open(self.path, 'a')
+                    atexit.register(self.close)
+                self._file.write(line)
+                self._file.flush()
+                self._counters['recorded'] += 1
+            except OSError as e:
+                print(f"Could not record Gemini traffic: {e}")
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def record(self, task: str, system: Optional[str], prompt: str, response: Optional[str], seconds: float):
+        if not self.recording:
+            return
+        self._append({
+            'k': make_key(task, system, prompt),
+            't': task,
+            'at': round(time.time(), 3),
+            'l': round(seconds, 4),
+            'p': len(system or '') + len(prompt),
+            'r': response
+        })
+
+    def record_stream(self, task: str, system: Optional[str], prompt: str, chunks: List[Tuple[float, str]], seconds: float):
+        if not self.recording:
+            return
+        self._append({
+            'k': make_key(task, system, prompt),
+            't': task,
+            'at': round(time.time(), 3),
+            'l': round(seconds, 4),
+            'p': len(system or '') + len(prompt),
+            'r': ''.join(text for _, text in chunks) if chunks else None,
+            'c': [[round(offset, 4), text] for offset, text in chunks]
+        })
+
+    def _next(self, task: str, system: Optional[str], prompt: str) -> Optional[Dict]:
+        """Next recorded answer for a prompt; repeated prompts cycle through
+        their recordings in order."""
+        with self._lock:
+            entries = self._entries.get(make_key(task, system, prompt))
+            if not entries:
+                self._counters['misses'] += 1
+                return None
+            entry = entries[0]
+            entries.rotate(-1)
+            self._counters['replayed'] += 1
+            return entry
+
+    def _sleep(self, seconds: float):
+        if seconds > 0 and self.latency_scale > 0:
+            time.sleep(seconds * self.latency_scale)
+
+    def replay(self, task: str, system: Optional[str], prompt: str) -> Optional[str]:
+        entry = self._next(task, system, prompt)
+        if entry is None:
+            return None
+        self._sleep(entry['l'])
+        return entry['r']
+
+    def replay_stream(self, task: str, system: Optional[str], prompt: str) -> Iterator[str]:
+        """Replay a recorded stream; returns whether it produced any text."""
+        entry = self._next(task, system, prompt)
+        if entry is None:
+            return False
+        chunks = entry.get('c')
+        if chunks is None:
+            # Recorded as a plain call; serve it as a single chunk
+            self._sleep(entry['l'])
+            if entry['r']:
+                yield entry['r']
+            return bool(entry['r'])
+        elapsed = 0.0
+        for offset, text in chunks:
+            self._sleep(offset - elapsed)
+            elapsed = offset
+            yield text
+        # Time after the last chunk, or until a stream that failed gave up
+        self._sleep(entry['l'] - elapsed)
+        return bool(chunks)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(self._counters, mode=self.mode, path=self.path, latency_scale=self.latency_scale)
@@ -0,0 +1,211 @@
+import threading
+from typing import Dict, List, Optional, Tuple
+
+# Rough chars-per-token ratio for English text with Gemini's tokenizer
+CHARS_PER_TOKEN = 4
+
+# Task-specific prompt bodies. Static sections in [[double brackets]] are
+# filled in once when the builder is created; {fields} are filled per call.
+TASK_TEMPLATES = {
+    'respond': """CURRENT SITUATION:
+Customer Query: "{query}"
+{context}
+{product_info}
+
+TASK: Respond as Alex, the friendly electronics sales assistant. Make your response natural and conversational:
+
+1. If products are available:
+   - Acknowledge their request warmly
+   - Recommend 2-3 best products with specific reasons why they're good fits
+   - Mention key features that matter for their use case
+   - Include prices naturally in conversation
+   - Ask a follow-up question to help them choose or learn more about their needs
+
+2. If no products found:
+   - Acknowledge what they're looking for
+   - Explain why no matches were found (but stay positive)
+   - Suggest similar alternatives or ask clarifying questions
+   - Offer to help them find something else
+
+3. If query is unclear:
+   - Ask friendly clarifying questions
+   - Suggest specific examples
+   - Show enthusiasm to help
+
+STYLE: Be conversational, helpful, and enthusiastic. Avoid robotic or template-like responses.""",
+
+    'turn': """CURRENT SITUATION:
+Customer Query: "{query}"
+{context}
+{product_info}
+
+TASK: Handle this turn in one pass.
+1. Classify the message (intent: product_search, greeting, question, comparison, complaint, other).
+2. Extract product search filters using the categories and attributes below.
+3. Write Alex's reply. Recommend 2-3 of the candidate products only if the customer wants products.
+4. Write 6 short follow-up suggestions the customer might click next.
+
+[[parsing_prompt]]
+
+Return ONLY JSON:
+{{
+    "intent": "string",
+    "urgency": "high|medium|low",
+    "sentiment": "positive|neutral|negative",
+    "needs_products": boolean,
+    "follow_up_needed": boolean,
+    "response_type": "product_recommendation|general_help|clarification|greeting",
+    "filters": {{}},
+    "reply": "string",
+    "suggestions": ["string"]
+}}""",
+
+    'intent': """CONVERSATION HISTORY:
+{history}
+
+CURRENT MESSAGE: "{message}"
+
+TASK: Analyze this conversation and determine:
+1. Intent: product_search, greeting, question, comparison, complaint, other
+2. Urgency: high, medium, low
+3. Sentiment: positive, neutral, negative
+4. Needs_products: true/false
+5. Follow_up_needed: true/false
+
+Return JSON:
+{{
+    "intent": "string",
+    "urgency": "string",
+    "sentiment": "string",
+    "needs_products": boolean,
+    "follow_up_needed": boolean,
+    "response_type": "product_recommendation|general_help|clarification|greeting"
+}}""",
+
+    'parse': """[[parsing_prompt]]
+
+User query: {message}""",
+
+    'suggest': """
+As Alex, an electronics shopping assistant, generate 6 helpful follow-up questions/suggestions based on this conversation context:
+
+Customer Query: "{query}"
+Conversation Type: {conversation_type}
+Products Found: {product_count}
+
+Product Categories: {categories}
+
+Generate suggestions that would naturally follow this conversation. Make them:
+1. Contextually relevant
+2. Action-oriented
+3. Helpful for decision making
+4. Varied in scope (specific product questions, comparisons, alternatives, etc.)
+
+Return ONLY 6 suggestions, one per line, without numbering or bullets.
+Examples of good suggestions:
+- "Tell me more about the first product"
+- "Which has the best battery life?"
+- "Show me budget alternatives under $200"
+- "Any wireless options available?"
+- "What's the difference between these models?"
+- "Which would you recommend for a student?"
+"""
+}
+
+# Tasks that run with the shared system prompt as their prefix
+SYSTEM_PREFIX_TASKS = {'respond', 'turn', 'intent'}
+
+
+def _escape_braces(text: str) -> str:
+    return text.replace('{', '{{').replace('}', '}}')
+
+
+def estimate_tokens(chars: int) -> int:
+    return (chars + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+class PromptBuilder:
+    """Assembles Gemini prompts from precompiled templates and tracks their size.
+
+    ``build`` returns ``(system, body)``: the shared system prompt (or None
+    for tasks that do not use it) and the task-specific body. Keeping the
+    prefix separate lets the request carry it as a system instruction or a
+    provider-side cached context instead of pasting it into every body.
+    """
+
+    def __init__(self, system_prompt: str, static_sections: Dict[str, str]):
+        self.system_prompt = system_prompt
+        self._templates = {}
+        for task, template in TASK_TEMPLATES.items():
+            for name, section in static_sections.items():
+                template = template.replace(f'[[{name}]]', _escape_braces(section))
+            self._templates[task] = template
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def build(self, task: str, **fields) -> Tuple[Optional[str], str]:
+        system = self.system_prompt if task in SYSTEM_PREFIX_TASKS else None
+        return system, self._templates[task].format(**fields)
+
+    @staticmethod
+    def format_history(history: Optional[List[Dict]], limit: int) -> str:
+        formatted = ""
+        history = history or []
+        # A rolling session summary always leads the history; keep it in
+        # addition to the most recent raw messages
+        if history and history[0].get('is_summary'):
+            formatted += f"Earlier in this conversation:\n{history[0]['message']}\n\n"
+            history = history[1:]
+        for msg in history[-limit:]:
+            role = "Customer" if not msg.get('is_bot') else "Alex"
+            formatted += f"{role}: {msg['message']}\n"
+        return formatted
+
+    @staticmethod
+    def format_products(products: Optional[List[Dict]], heading: str, empty_text: str, limit: int = 5) -> str:
+        if not products:
+            return f"\n\n{empty_text}"
+        product_info = f"\n\n{heading}:\n"
+        for i, product in enumerate(products[:limit], 1):
+            product_info += f"{i}. {product['name']} - ${product['price']:.2f}\n"
+            product_info += f"   Category: {product['category']}, Style: {product.get('style', 'N/A')}\n"
+            product_info += f"   Rating: {product.get('rating', 0):.1f}/5, Stock: {product.get('stock_quantity', 0)}\n"
+            if product.get('description'):
+                product_info += f"   Description: {product['description'][:100]}...\n"
+            product_info += "\n"
+        return product_info
+
+    def record(self, task: str, system: Optional[str], body: str, prefix_cached: bool = False):
+        """Account for a prompt that is about to be sent.
+
+        A prefix served from the provider cache still counts towards the
+        prompt size the model sees, but not towards the bytes we upload.
+        """
+        system_chars = len(system) if system else 0
+        prompt_chars = system_chars + len(body)
+        sent_chars = len(body) if prefix_cached else prompt_chars
+        with self._lock:
+            stats = self._stats.setdefault(task, {
+                'calls': 0, 'prompt_chars': 0, 'sent_chars': 0, 'max_prompt_chars': 0,
+                'system_prefix_chars': 0, 'prefix_cache_hits': 0
+            })
+            stats['calls'] += 1
+            stats['prompt_chars'] += prompt_chars
+            stats['sent_chars'] += sent_chars
+            stats['max_prompt_chars'] = max(stats['max_prompt_chars'], prompt_chars)
+            stats['system_prefix_chars'] += system_chars
+            if prefix_cached:
+                stats['prefix_cache_hits'] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            result = {}
+            for task, stats in self._stats.items():
+                calls = stats['calls'] or 1
+                result[task] = dict(
+                    stats,
+                    estimated_tokens=estimate_tokens(stats['prompt_chars']),
+                    avg_prompt_chars=stats['prompt_chars'] // calls,
+                    avg_estimated_tokens=estimate_tokens(stats['prompt_chars'] // calls)
+                )
+            return result
@@ -0,0 +1,85 @@
+import copy
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+# Words that carry no search intent; "show me laptops" and "i need laptops"
+# should land on the same memo entry.
+FILLER_WORDS = {
+    'a', 'an', 'the', 'some', 'any', 'please', 'pls', 'plz', 'hey', 'hi', 'hello',
+    'can', 'could', 'would', 'you', 'show', 'me', 'find', 'get', 'buy', 'i', 'im',
+    "i'm", 'id', "i'd", 'want', 'need', 'looking', 'for', 'to', 'like', 'just',
+    'really', 'kindly', 'something', 'maybe'
+}
+
+_CURRENCY = re.compile(r'\$|\busd\b|\bdollars?\b|\bbucks\b')
+_THOUSANDS_SEPARATOR = re.compile(r'(?<=\d),(?=\d{3}\b)')
+# Only expand "k" in a price context so "4k monitor" stays a resolution
+_K_SUFFIX = re.compile(
+    r'((?:\$|\b(?:under|below|over|above|around|about|between|and|to|budget|max|within|than)\s+\$?|-\s*\$?)\s*)'
+    r'(\d+(?:\.\d+)?)\s*k\b'
+)
+_PUNCTUATION = re.compile(r"[^\w\s\-.']|\.(?!\d)")
+
+
+def _expand_thousands(match) -> str:
+    return match.group(1) + str(int(round(float(match.group(2)) * 1000)))
+
+
+def normalize_prices(text: str) -> str:
+    """Rewrite "$1k", "1,000 dollars" and "1.5k" as plain integers."""
+    text = _K_SUFFIX.sub(_expand_thousands, text)
+    text = _THOUSANDS_SEPARATOR.sub('', text)
+    return _CURRENCY.sub(' ', text)
+
+
+def canonicalize(message: str, strip_fillers: bool = True) -> str:
+    """Canonical form of a search message: lowercased, prices normalized,
+    punctuation and (optionally) filler words removed, whitespace collapsed."""
+    text = normalize_prices((message or '').lower())
+    text = _PUNCTUATION.sub(' ', text)
+    words = text.split()
+    if strip_fillers:
+        words = [word for word in words if word not in FILLER_WORDS]
+    return ' '.join(words)
+
+
+class FilterMemo:
+    """Bounded LRU table from canonical query text to parsed filters."""
+
+    def __init__(self, max_entries: int = 2048):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, canonical: str) -> Optional[Dict]:
+        with self._lock:
+            filters = self._entries.get(canonical)
+            if filters is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(canonical)
+            self.hits += 1
+            # Callers mutate filter dicts, so never hand out the stored one
+            return copy.deepcopy(filters)
+
+    def set(self, canonical: str, filters: Dict):
+        with self._lock:
+            self._entries[canonical] = copy.deepcopy(filters)
+            self._entries.move_to_end(canonical)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0
+            }
@@ -0,0 +1,281 @@
+import hashlib
+import math
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: buckets can only be kept per process
+    fcntl = None
+
+# KEYS = buckets; ARGV = now, cost, then capacity and refill per second for
+# each bucket. Tokens are only taken when every bucket has ``cost`` of them.
+# Returns {allowed, tokens left * 1000 per bucket} so fractions survive
+# Redis' integer replies.
+_REDIS_TAKE = """
+local now = tonumber(ARGV[1])
+local cost = tonumber(ARGV[2])
+local tokens = {}
+local allowed = 1
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[1 + i * 2])
+    local rate = tonumber(ARGV[2 + i * 2])
+    local state = redis.call('HMGET', key, 'tokens', 'updated')
+    local left = tonumber(state[1]) or capacity
+    local updated = tonumber(state[2]) or now
+    tokens[i] = math.min(capacity, left + math.max(0, now - updated) * rate)
+    if tokens[i] < cost then
+        allowed = 0
+    end
+end
+local result = {allowed}
+for i, key in ipairs(KEYS) do
+    local capacity = tonumber(ARGV[1 + i * 2])
+    local rate = tonumber(ARGV[2 + i * 2])
+    if allowed == 1 then
+        tokens[i] = tokens[i] - cost
+    end
+    redis.call('HSET', key, 'tokens', tokens[i], 'updated', now)
+    redis.call('PEXPIRE', key, math.ceil((capacity - tokens[i]) / rate * 1000) + 1000)
+    result[i + 1] = math.floor(tokens[i] * 1000)
+end
+return result
+"""
+
+# (key, capacity, refill per second) of one bucket
+Bucket = Tuple[str, float, float]
+
+
+class MemoryBuckets:
+    """Token buckets held in this process; for single-node deployments."""
+
+    name = 'memory'
+
+    def __init__(self, max_keys: int = 10000):
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def take(self, buckets: List[Bucket], cost: float = 1) -> Tuple[bool, List[float]]:
+        """Take ``cost`` tokens from every bucket, or from none of them if
+        any is short; returns (allowed, tokens left in each bucket)."""
+        now = time.monotonic()
+        with self._lock:
+            tokens = []
+            for key, capacity, rate in buckets:
+                left, updated, _ = self._buckets.get(key, (capacity, now, 0))
+                tokens.append(min(capacity, left + (now - updated) * rate))
+            allowed = all(left >= cost for left in tokens)
+            if allowed:
+                tokens = [left - cost for left in tokens]
+            for (key, capacity, rate), left in zip(buckets, tokens):
+                self._buckets[key] = (left, now, capacity / rate)
+            if len(self._buckets) > self.max_keys:
+                self._prune(now)
+            return allowed, tokens
+
+    def _prune(self, now: float):
+        # Buckets that have refilled completely carry no state worth keeping
+        for key, (_, updated, full_after) in list(self._buckets.items()):
+            if now - updated >= full_after:
+                del self._buckets[key]
+
+
+class FileBuckets:
+    """Token buckets shared by every worker on the host.
+
+    Each bucket is a small file in ``lock_dir`` holding its tokens and the
+    time they were counted; a take flocks the files it touches (in a fixed
+    order, so two takes cannot deadlock) for the few microseconds it needs
+    to read and rewrite them.
+    """
+
+    name = 'file'
+    _SWEEP_EVERY = 1000
+
+    def __init__(self, lock_dir: str):
+        self.lock_dir = lock_dir
+        os.makedirs(self.lock_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._takes = 0
+        self._full_after = 0.0
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.lock_dir, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.bucket')
+
+    def take(self, buckets: List[Bucket], cost: float = 1) -> Tuple[bool, List[float]]:
+        now = time.time()
+        order = sorted(range(len(buckets)), key=lambda i: self._path(buckets[i][0]))
+        fds = {}
+        try:
+            for i in order:
+                fds[i] = os.open(self._path(buckets[i][0]), os.O_CREAT | os.O_RDWR, 0o644)
+                fcntl.flock(fds[i], fcntl.LOCK_EX)
+            tokens = []
+            for i, (_, capacity, rate) in enumerate(buckets):
+                try:
+                    left, updated = (float(value) for value in os.pread(fds[i], 64, 0).split())
+                except ValueError:  # new or unreadable bucket
+                    left, updated = capacity, now
+                tokens.append(min(capacity, left + max(0.0, now - updated) * rate))
+            allowed = all(left >= cost for left in tokens)
+            if allowed:
+                tokens = [left - cost for left in tokens]
+            for i, left in enumerate(tokens):
+                os.ftruncate(fds[i], 0)
+                os.pwrite(fds[i], f"{left} {now}".encode('ascii'), 0)
+        finally:
+            for fd in fds.values():
+                # Closing the descriptor drops its flock
+                os.close(fd)
+
+        with self._lock:
+            self._takes += 1
+            self._full_after = max([self._full_after] + [capacity / rate for _, capacity, rate in buckets])
+            sweep = self._takes % self._SWEEP_EVERY == 0
+        if sweep:
+            self._sweep(now)
+        return allowed, tokens
+
+    def _sweep(self, now: float):
+        # Buckets that have refilled completely carry no state worth keeping
+        cutoff = now - self._full_after - 60
+        try:
+            for entry in os.scandir(self.lock_dir):
+                if entry.name.endswith('.bucket') and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+        except OSError as e:
+            print(f"Could not sweep rate limit directory: {e}")
+
+
+class RedisBuckets:
+    """Token buckets in Redis, shared by every node; updated atomically by a
+    Lua script. If Redis cannot be reached requests are let through."""
+
+    name = 'redis'
+
+    def __init__(self, client, prefix: str = 'ratelimit:'):
+        self.client = client
+        self.prefix = prefix
+        self._take = client.register_script(_REDIS_TAKE)
+
+    def take(self, buckets: List[Bucket], cost: float = 1) -> Tuple[bool, List[float]]:
+        args = [time.time(), cost]
+        for _, capacity, rate in buckets:
+            args += [capacity, rate]
+        try:
+            result = self._take(keys=[self.prefix + key for key, _, _ in buckets], args=args)
+            return bool(result[0]), [tokens / 1000 for tokens in result[1:]]
+        except Exception as e:
+            print(f"Rate limiter Redis call failed, allowing request: {e}")
+            return True, [capacity for _, capacity, _ in buckets]
+
+
+class RateLimit:
+    """Outcome of one rate-limit check, with the values for its headers.
+
+    ``reset`` is the number of seconds until the bucket is full again and
+    ``retry_after``, set on refusals, until the next token is available.
+    """
+
+    def __init__(self, allowed: bool, limit: int, remaining: float, reset: float, retry_after: Optional[float] = None):
+        self.allowed = allowed
+        self.limit = limit
+        self.remaining = remaining
+        self.reset = reset
+        self.retry_after = retry_after
+
+    def headers(self) -> Dict[str, str]:
+        headers = {
+            'X-RateLimit-Limit': str(self.limit),
+            'X-RateLimit-Remaining': str(max(0, int(self.remaining))),
+            'X-RateLimit-Reset': str(math.ceil(self.reset))
+        }
+        if self.retry_after is not None:
+            headers['Retry-After'] = str(max(1, math.ceil(self.retry_after)))
+        return headers
+
+
+class ChatRateLimiter:
+    """Per-user token buckets plus one global bucket for the chat endpoints.
+
+    Each user may burst ``user_burst`` messages and then
+    ``user_per_minute`` a minute; all users together get ``global_burst``
+    and ``global_per_minute``. A request must find a token in both, and
+    a refused request takes from neither.
+    """
+
+    def __init__(self, buckets, user_per_minute: float, user_burst: int,
+                 global_per_minute: float, global_burst: int):
+        self.buckets = buckets
+        self.user_rate = user_per_minute / 60
+        self.user_burst = user_burst
+        self.global_rate = global_per_minute / 60
+        self.global_burst = global_burst
+        self._lock = threading.Lock()
+        self._counters = {'allowed': 0, 'user_limited': 0, 'global_limited': 0}
+
+    @classmethod
+    def from_config(cls, config) -> Optional['ChatRateLimiter']:
+        if not config.get('CHAT_RATE_LIMIT_ENABLED', True):
+            return None
+        backend = config.get('CHAT_RATE_LIMIT_BACKEND', 'file')
+        buckets = MemoryBuckets()
+        if backend == 'file':
+            if fcntl is not None:
+                buckets = FileBuckets(config['CHAT_RATE_LIMIT_DIR'])
+            else:
+                print("Chat rate limiter running in memory, file locks unavailable; limits apply per worker")
+        elif backend == 'redis':
+            try:
+                from redis import Redis
+                client = Redis.from_url(config['REDIS_URL'], socket_timeout=0.2, socket_connect_timeout=0.2)
+                client.ping()
+                buckets = RedisBuckets(client)
+            except Exception as e:
+                print(f"Chat rate limiter running in memory, Redis unavailable: {e}")
+        for setting in ('CHAT_RATE_LIMIT_PER_MINUTE', 'CHAT_RATE_LIMIT_BURST',
+                        'CHAT_GLOBAL_RATE_LIMIT_PER_MINUTE', 'CHAT_GLOBAL_RATE_LIMIT_BURST'):
+            if config[setting] <= 0:
+                raise ValueError(f"{setting} must be greater than 0; set CHAT_RATE_LIMIT_ENABLED=false to turn the limit off")
+        return cls(
+            buckets,
+            user_per_minute=config['CHAT_RATE_LIMIT_PER_MINUTE'],
+            user_burst=config['CHAT_RATE_LIMIT_BURST'],
+            global_per_minute=config['CHAT_GLOBAL_RATE_LIMIT_PER_MINUTE'],
+            global_burst=config['CHAT_GLOBAL_RATE_LIMIT_BURST']
+        )
+
+    def _count(self, outcome: str):
+        with self._lock:
+            self._counters[outcome] += 1
+
+    def check(self, identity: str) -> RateLimit:
+        allowed, (user_tokens, global_tokens) = self.buckets.take([
+            (f"user:{identity}", self.user_burst, self.user_rate),
+            ('global', self.global_burst, self.global_rate)
+        ])
+        reset = (self.user_burst - user_tokens) / self.user_rate
+        if allowed:
+            self._count('allowed')
+            return RateLimit(True, self.user_burst, user_tokens, reset)
+        if user_tokens < 1:
+            self._count('user_limited')
+            retry_after = (1 - user_tokens) / self.user_rate
+        else:
+            self._count('global_limited')
+            retry_after = (1 - global_tokens) / self.global_rate
+        return RateLimit(False, self.user_burst, user_tokens, reset, retry_after=retry_after)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(
+                self._counters,
+                backend=self.buckets.name,
+                user_per_minute=self.user_rate * 60,
+                user_burst=self.user_burst,
+                global_per_minute=self.global_rate * 60,
+                global_burst=self.global_burst
+            )
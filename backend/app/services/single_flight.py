@@ -0,0 +1,185 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows has no flock; cross-worker coalescing stays off
+    fcntl = None
+
+# How often waiting callers wake up to check for cancellation or a freed lock
+_POLL_INTERVAL = 0.05
+# Lock and result files untouched for this long belong to finished calls
+_STALE_FILE_SECONDS = 300
+_SWEEP_EVERY = 200
+
+
+def make_key(*parts: Optional[str]) -> str:
+    return hashlib.sha256('\x00'.join(part or '' for part in parts).encode('utf-8')).hexdigest()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        # The leader gave up because of its own cancellation or deadline
+        self.abandoned = False
+
+
+class SingleFlight:
+    """Coalesces identical calls that are in flight at the same time.
+
+    The first caller for a key runs the function; callers that arrive with
+    the same key while it is running wait for its result instead of making
+    their own call. With ``lock_dir`` set, workers on the same host also
+    coalesce through flock'd files in that directory: the worker holding a
+    key's lock publishes its result next to it for the others to pick up.
+
+    ``cancelled`` tells whether the caller's own call was abandoned or ran
+    out of time. Followers stop waiting when it turns true; a leader that
+    comes back empty-handed while it is true failed for reasons of its own,
+    so its followers do not share that result and one of them leads a new
+    call instead.
+    """
+
+    def __init__(self, wait_timeout: float = 30, lock_dir: Optional[str] = None, result_ttl: float = 10):
+        self.wait_timeout = wait_timeout
+        self.result_ttl = result_ttl
+        self.lock_dir = lock_dir if lock_dir and fcntl is not None else None
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._counters = {'leaders': 0, 'coalesced': 0, 'coalesced_across_workers': 0, 'wait_timeouts': 0,
+                          'leader_abandoned': 0}
+        self._writes = 0
+
+    def _count(self, field: str):
+        with self._lock:
+            self._counters[field] += 1
+
+    def do(self, key: str, func: Callable[[], Optional[str]],
+           cancelled: Callable[[], bool] = None) -> Optional[str]:
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                leader = call is None
+                if leader:
+                    call = self._calls[key] = _Call()
+
+            if leader:
+                return self._lead(key, call, func, cancelled)
+
+            self._count('coalesced')
+            if not self._wait(call, cancelled):
+                return None
+            if not call.abandoned:
+                return call.result
+            self._count('leader_abandoned')
+
+    def _lead(self, key: str, call: _Call, func: Callable[[], Optional[str]],
+              cancelled: Callable[[], bool] = None) -> Optional[str]:
+        try:
+            if self.lock_dir:
+                call.result = self._do_across_workers(key, func, cancelled)
+            else:
+                self._count('leaders')
+                call.result = func()
+            call.abandoned = call.result is None and cancelled is not None and cancelled()
+            return call.result
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def _wait(self, call: _Call, cancelled: Callable[[], bool] = None) -> bool:
+        """Wait for the leader; False if this caller gave up first."""
+        deadline = time.monotonic() + self.wait_timeout
+        while not call.done.wait(_POLL_INTERVAL):
+            if cancelled is not None and cancelled():
+                return False
+            if time.monotonic() >= deadline:
+                self._count('wait_timeouts')
+                return False
+        return True
+
+    def _paths(self, key: str):
+        base = os.path.join(self.lock_dir, key)
+        return base + '.lock', base + '.json'
+
+    def _read_result(self, result_path: str, since: float) -> Optional[str]:
+        try:
+            with open(result_path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # Only a result finished after we started waiting answers our call
+        if entry.get('finished_at', 0) < since or time.time() - entry['finished_at'] > self.result_ttl:
+            return None
+        return entry.get('result')
+
+    def _write_result(self, result_path: str, result: str):
+        tmp_path = f"{result_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump({'finished_at': time.time(), 'result': result}, f)
+            os.replace(tmp_path, result_path)
+        except OSError as e:
+            print(f"Could not publish coalesced result: {e}")
+        with self._lock:
+            self._writes += 1
+            sweep = self._writes % _SWEEP_EVERY == 0
+        if sweep:
+            self._sweep()
+
+    def _sweep(self):
+        """Remove files of keys nobody has asked for in a while."""
+        cutoff = time.time() - max(_STALE_FILE_SECONDS, 2 * self.wait_timeout)
+        try:
+            for entry in os.scandir(self.lock_dir):
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+        except OSError as e:
+            print(f"Could not sweep single-flight lock directory: {e}")
+
+    def _do_across_workers(self, key: str, func: Callable[[], Optional[str]],
+                           cancelled: Callable[[], bool] = None) -> Optional[str]:
+        lock_path, result_path = self._paths(key)
+        started_at = time.time()
+        deadline = time.monotonic() + self.wait_timeout
+        waited = False
+        with open(lock_path, 'a') as lock_file:
+            while True:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    waited = True
+                    if cancelled is not None and cancelled():
+                        return None
+                    if time.monotonic() >= deadline:
+                        self._count('wait_timeouts')
+                        return None
+                    time.sleep(_POLL_INTERVAL)
+            try:
+                # Mark the key as live so the sweeper leaves its lock alone
+                os.utime(lock_path)
+                if waited:
+                    result = self._read_result(result_path, started_at)
+                    if result is not None:
+                        self._count('coalesced_across_workers')
+                        return result
+                self._count('leaders')
+                result = func()
+                if result is not None:
+                    self._write_result(result_path, result)
+                return result
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return dict(self._counters, in_flight=len(self._calls), across_workers=self.lock_dir is not None)
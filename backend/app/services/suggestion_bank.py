@@ -0,0 +1,296 @@
+import bisect
+import json
+import math
+import os
+import threading
+from collections import Counter
+from itertools import combinations
+from typing import Dict, List, Optional
+
+DEFAULT_BANK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'suggestion_bank.json')
+BANK_VERSION = 1
+
+# Suggestions for turns that are not about a specific result set
+TYPE_SUGGESTIONS = {
+    'greeting': [
+        "I need a laptop for work",
+        "Show me gaming headphones",
+        "Looking for a smartphone",
+        "Best tablets for students",
+        "Wireless earbuds under $100",
+        "What's trending in electronics?"
+    ],
+    'clarification': [
+        "Show me laptops instead",
+        "I need smartphones",
+        "Looking for headphones",
+        "Show me tablets",
+        "Any gaming accessories?",
+        "What electronics do you have?"
+    ],
+    'general_help': [
+        "Help me find a laptop",
+        "Show me trending products",
+        "What's on sale?",
+        "I need tech for work",
+        "Best gaming gear",
+        "Show me budget options"
+    ],
+    'product_recommendation': [
+        "Show me more options",
+        "What's your best recommendation?",
+        "Any budget alternatives?",
+        "Tell me about the warranties",
+        "Show me customer reviews",
+        "Compare top 3 products"
+    ]
+}
+
+CATEGORY_QUESTIONS = {
+    'smartphones': [
+        "Which has the best camera?",
+        "Show me phones with long battery life",
+        "Any 5G compatible models?",
+        "What about storage options?"
+    ],
+    'audio': [
+        "Which has the best sound quality?",
+        "Any noise-canceling options?",
+        "Show me wireless models",
+        "Which is most comfortable?"
+    ],
+    'computers': [
+        "Which is best for gaming?",
+        "Show me lightweight options",
+        "What about battery life?",
+        "Which has the best display?"
+    ],
+    'gaming': [
+        "Which has the best performance?",
+        "Any wireless options?",
+        "What games work with it?",
+        "Which is best for competitive play?"
+    ]
+}
+GENERIC_QUESTIONS = [
+    "Which is the best value?",
+    "What are the key differences?",
+    "Which has the best reviews?",
+    "What's included in the box?"
+]
+
+CATEGORY_NOUNS = {
+    'smartphones': 'phones',
+    'computers': 'laptops',
+    'audio': 'audio gear',
+    'gaming': 'gaming gear',
+    'tv & display': 'TVs',
+    'tablet': 'tablets',
+    'camera': 'cameras',
+    'wearable': 'wearables',
+    'smart home': 'smart home devices',
+    'computer': 'computer accessories',
+    'display': 'displays',
+    'entertainment': 'streaming devices',
+    'transportation': 'e-scooters'
+}
+# Subcategories that read as adjectives ("flagship phones", not "flagships")
+ADJECTIVE_SUBCATEGORIES = {'flagship', 'budget', 'gaming'}
+
+BAND_NAMES = ['budget', 'mid', 'premium']
+# Below this share of the results, the top category does not dominate
+DOMINANT_SHARE = 0.6
+
+
+def _key(value) -> str:
+    return str(value or '').strip().lower()
+
+
+def _noun(category: str) -> str:
+    return CATEGORY_NOUNS.get(category, f"{category} products")
+
+
+def _sub_noun(subcategory: str, category: str) -> str:
+    if subcategory in ADJECTIVE_SUBCATEGORIES:
+        return f"{subcategory} {_noun(category)}"
+    return subcategory if subcategory.endswith('s') else f"{subcategory}s"
+
+
+def _band_edges(prices: List[float]) -> List[int]:
+    """Tertile edges of a category's prices, rounded up to $50."""
+    if len(prices) < 3:
+        return []
+    prices = sorted(prices)
+    edges = [int(math.ceil(prices[len(prices) * i // 3] / 50.0) * 50) for i in (1, 2)]
+    return edges if edges[0] < edges[1] else []
+
+
+def _dedupe(suggestions: List[str], limit: int = 6) -> List[str]:
+    result = []
+    for suggestion in suggestions:
+        if suggestion not in result:
+            result.append(suggestion)
+    return result[:limit]
+
+
+def build_bank(products: List[Dict]) -> Dict:
+    """Precompute suggestion lists for every category, subcategory, price
+    band, style and category pair found in a product catalog."""
+    by_category = {}
+    for product in products:
+        by_category.setdefault(_key(product.get('category')), []).append(product)
+    by_category.pop('', None)
+
+    entries = {f"type:{name}": list(suggestions) for name, suggestions in TYPE_SUGGESTIONS.items()}
+    bands = {}
+    for category, items in sorted(by_category.items()):
+        noun = _noun(category)
+        questions = CATEGORY_QUESTIONS.get(category, GENERIC_QUESTIONS)
+        brands = [brand for brand, _ in Counter(p['brand'] for p in items if p.get('brand')).most_common(2)]
+        subcategories = sorted({_key(p.get('subcategory')) for p in items} - {''})
+        styles = sorted({_key(p.get('style')) for p in items} - {''})
+
+        entries[f"cat:{category}"] = _dedupe(
+            questions + [f"Compare the top {noun}"] + [f"Anything from {brand}?" for brand in brands]
+        )
+        for subcategory in subcategories:
+            sub_noun = _sub_noun(subcategory, category)
+            siblings = [_sub_noun(other, category) for other in subcategories if other != subcategory]
+            entries[f"cat:{category}|sub:{subcategory}"] = _dedupe(
+                [f"Compare the top {sub_noun}"] + questions[:3] + [f"Show me {sibling} instead" for sibling in siblings]
+            )
+        for style in styles:
+            entries[f"cat:{category}|style:{style}"] = [
+                f"Show me more {style} options",
+                f"Which {style} pick would you recommend?"
+            ]
+
+        edges = _band_edges([p['price'] for p in items if p.get('price')])
+        if edges:
+            bands[category] = edges
+            entries[f"cat:{category}|band:budget"] = [f"Show me {noun} under ${edges[0]}", "Which is the best value?"]
+            entries[f"cat:{category}|band:mid"] = [f"Any {noun} under ${edges[0]}?", f"What do I get for over ${edges[1]}?"]
+            entries[f"cat:{category}|band:premium"] = ["Is the premium model worth it?", f"Show me {noun} under ${edges[1]}"]
+
+    for first, second in combinations(sorted(by_category), 2):
+        entries[f"mix:{first}+{second}"] = [
+            f"Compare the {_noun(first)} and {_noun(second)}",
+            f"Show me only {_noun(first)}",
+            f"Show me only {_noun(second)}",
+            "Which is the best value?",
+            "What's your top pick?",
+            "Any budget alternatives?"
+        ]
+
+    return {'version': BANK_VERSION, 'bands': bands, 'entries': entries}
+
+
+class SuggestionBank:
+    """Follow-up suggestions precomputed from the catalog.
+
+    The bank is a flat table of suggestion lists keyed by result shape, so a
+    lookup is a handful of dict probes. ``match`` returns None when the
+    table knows nothing specific about the results; callers then ask the
+    LLM. Build the file with ``python build_suggestion_bank.py``.
+    """
+
+    def __init__(self, bank: Dict):
+        self.entries = bank.get('entries', {})
+        self.bands = bank.get('bands', {})
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_BANK_PATH) -> 'SuggestionBank':
+        try:
+            with open(path) as f:
+                bank = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Suggestion bank unavailable ({e}), using generic suggestions only")
+            bank = build_bank([])
+        return cls(bank)
+
+    def _result_shape(self, products: Optional[List[Dict]], filters: Optional[Dict]):
+        """(category, category pair) describing what the results are about.
+
+        The products decide; the filter category, which the search may not
+        have honoured, is only used when there are no products.
+        """
+        counts = Counter(_key(p.get('category')) for p in products or [] if p.get('category'))
+        if not counts:
+            category = _key((filters or {}).get('category'))
+            return (category, None) if f"cat:{category}" in self.entries else (None, None)
+        (top, top_count), *rest = counts.most_common(2)
+        if rest and top_count / sum(counts.values()) < DOMINANT_SHARE:
+            return None, '+'.join(sorted([top, rest[0][0]]))
+        return top, None
+
+    def _band(self, category: str, products: Optional[List[Dict]], filters: Optional[Dict]) -> Optional[str]:
+        edges = self.bands.get(category)
+        if not edges:
+            return None
+        price_range = (filters or {}).get('price_range') or {}
+        price = price_range.get('max') or price_range.get('min')
+        if not price:
+            prices = sorted(p['price'] for p in products or [] if p.get('price'))
+            if not prices:
+                return None
+            price = prices[len(prices) // 2]
+        return BAND_NAMES[bisect.bisect_left(edges, price)]
+
+    def match(self, conversation_type: str, products: List[Dict] = None, filters: Dict = None) -> Optional[List[str]]:
+        """Suggestions for this result shape, or None without a specific match."""
+        if conversation_type != 'product_recommendation':
+            return self.entries.get(f"type:{conversation_type}")
+
+        category, mix = self._result_shape(products, filters)
+        lists = []
+        if mix:
+            lists.append(self.entries.get(f"mix:{mix}"))
+        elif category:
+            subcategory = ''
+            if _key((filters or {}).get('category')) == category:
+                subcategory = _key((filters or {}).get('subcategory'))
+            if not subcategory:
+                subcategories = Counter(_key(p.get('subcategory')) for p in products or []
+                                        if _key(p.get('category')) == category and p.get('subcategory'))
+                subcategory = subcategories.most_common(1)[0][0] if subcategories else ''
+            band = self._band(category, products, filters)
+            style = _key((filters or {}).get('style'))
+            lists.extend([
+                self.entries.get(f"cat:{category}|sub:{subcategory}"),
+                self.entries.get(f"cat:{category}|band:{band}"),
+                self.entries.get(f"cat:{category}|style:{style}"),
+                self.entries.get(f"cat:{category}")
+            ])
+        lists = [suggestions for suggestions in lists if suggestions]
+        with self._lock:
+            if not lists:
+                self.misses += 1
+                return None
+            self.hits += 1
+
+        # Interleave so the price band and style lines are not crowded out
+        # by the longer category lists
+        lists.append(self.entries.get('type:product_recommendation', []))
+        merged = []
+        for position in range(max(len(suggestions) for suggestions in lists)):
+            merged.extend(suggestions[position] for suggestions in lists if position < len(suggestions))
+        return _dedupe(merged)
+
+    def lookup(self, conversation_type: str, products: List[Dict] = None, filters: Dict = None) -> List[str]:
+        """Like ``match`` but falls back to the generic list for the turn type."""
+        return (self.match(conversation_type, products, filters)
+                or self.entries.get(f"type:{conversation_type}")
+                or list(TYPE_SUGGESTIONS['product_recommendation']))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0
+            }
@@ -0,0 +1,30 @@
+#!/usr/bin/env python3
+"""
+Suggestion Bank Builder
+Precomputes chat follow-up suggestions from the seed catalog so the chat
+only asks Gemini for suggestions the bank cannot answer
+"""
+import json
+import os
+import sys
+
+# Add the backend directory to the Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from enhanced_seed_data import get_electronics_products, get_budget_electronics
+from app.services.suggestion_bank import DEFAULT_BANK_PATH, build_bank
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_BANK_PATH
+    print("🧠 Building suggestion bank from the seed catalog...")
+    
+    bank = build_bank(get_electronics_products() + get_budget_electronics())
+    with open(path, 'w') as f:
+        json.dump(bank, f, separators=(',', ':'), sort_keys=True)
+    
+    print(f"✅ Wrote {len(bank['entries'])} suggestion lists to {path}")
+    return True
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
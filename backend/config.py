@@ -1,4 +1,5 @@
 import os
+import tempfile
 from datetime import timedelta
 from dotenv import load_dotenv
 
@@ -15,6 +16,16 @@ class Config:
     if SQLALCHEMY_DATABASE_URI.startswith('postgres://'):
         SQLALCHEMY_DATABASE_URI = SQLALCHEMY_DATABASE_URI.replace('postgres://', 'postgresql://', 1)
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ENGINE_OPTIONS = {'pool_pre_ping': True}
+    # Size the pool to the worker's concurrency (GUNICORN_THREADS or gevent
+    # connections); chat turns release their connection while waiting on
+    # Gemini. Applied by init_app to server databases only: SQLite's
+    # SingletonThreadPool/StaticPool reject these options.
+    DB_POOL_OPTIONS = {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', '5')),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', '10')),
+        'pool_timeout': int(os.getenv('DB_POOL_TIMEOUT', '10'))
+    }
     
     # File upload
     UPLOAD_FOLDER = os.getenv('UPLOAD_FOLDER', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'uploads'))
@@ -41,11 +52,43 @@ class Config:
     
     # Chat config
     MAX_CHAT_HISTORY = 100  # Maximum number of messages to store per user
+    # Once a session's unsummarized messages exceed this many characters the
+    # older ones are folded into a rolling summary used in prompts instead
+    CHAT_SUMMARY_THRESHOLD = int(os.getenv('CHAT_SUMMARY_THRESHOLD', '2000'))
+    CHAT_SUMMARY_KEEP_RECENT = int(os.getenv('CHAT_SUMMARY_KEEP_RECENT', '4'))
+    CHAT_SUMMARY_MAX_CHARS = int(os.getenv('CHAT_SUMMARY_MAX_CHARS', '1200'))
+    # Time budget of one chat turn in seconds; stages that would overrun it
+    # answer from their local fallbacks (see X-Deadline-Ms in chat.py)
+    CHAT_DEADLINE_SECONDS = float(os.getenv('CHAT_DEADLINE_SECONDS', '20'))
+    
+    # Admission control: at most this many chat (low) and browsing (medium)
+    # requests in flight across the host's workers, 0 for no limit. Checkout
+    # and cart are never limited. Excess requests get a 503 with Retry-After.
+    # Off by default; size it from the worker mode (see DEPLOYMENT.md).
+    ADMISSION_LOW_MAX_IN_FLIGHT = int(os.getenv('ADMISSION_LOW_MAX_IN_FLIGHT', '0'))
+    ADMISSION_MEDIUM_MAX_IN_FLIGHT = int(os.getenv('ADMISSION_MEDIUM_MAX_IN_FLIGHT', '0'))
+    ADMISSION_RETRY_AFTER = int(os.getenv('ADMISSION_RETRY_AFTER', '2'))
+    ADMISSION_LOCK_DIR = os.getenv('ADMISSION_LOCK_DIR') or os.path.join(tempfile.gettempdir(), 'ecommerce-admission')
+    
+    # Token-bucket rate limits on the chat endpoints, per JWT identity and
+    # for all users together. 'file' shares the buckets between the host's
+    # workers through CHAT_RATE_LIMIT_DIR, 'redis' between every node through
+    # REDIS_URL; 'memory' keeps them per worker process
+    CHAT_RATE_LIMIT_ENABLED = os.getenv('CHAT_RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+    CHAT_RATE_LIMIT_BACKEND = os.getenv('CHAT_RATE_LIMIT_BACKEND', 'file')
+    CHAT_RATE_LIMIT_DIR = os.getenv('CHAT_RATE_LIMIT_DIR') or os.path.join(tempfile.gettempdir(), 'ecommerce-ratelimit')
+    CHAT_RATE_LIMIT_PER_MINUTE = float(os.getenv('CHAT_RATE_LIMIT_PER_MINUTE', '10'))
+    CHAT_RATE_LIMIT_BURST = int(os.getenv('CHAT_RATE_LIMIT_BURST', '5'))
+    CHAT_GLOBAL_RATE_LIMIT_PER_MINUTE = float(os.getenv('CHAT_GLOBAL_RATE_LIMIT_PER_MINUTE', '300'))
+    CHAT_GLOBAL_RATE_LIMIT_BURST = int(os.getenv('CHAT_GLOBAL_RATE_LIMIT_BURST', '50'))
     
     @staticmethod
     def init_app(app):
         # Create upload folder if it doesn't exist
         os.makedirs(Config.UPLOAD_FOLDER, exist_ok=True)
+        if not app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+            app.config['SQLALCHEMY_ENGINE_OPTIONS'] = dict(app.config['SQLALCHEMY_ENGINE_OPTIONS'],
+                                                           **app.config['DB_POOL_OPTIONS'])
 
 class DevelopmentConfig(Config):
     """Development configuration."""
@@ -8,8 +8,13 @@ backlog = 2048
 
 # Worker processes - Limit for free tier
 workers = min(multiprocessing.cpu_count() * 2 + 1, 4)
-worker_class = 'sync'  # Using sync workers for better compatibility
-worker_connections = 1000
+# 'sync' by default for compatibility. Chat turns spend nearly all their time
+# waiting on Gemini, so 'gthread' (GUNICORN_THREADS per worker) or 'gevent'
+# (needs gevent + psycogreen installed) lets each worker hold many turns at
+# once. See DEPLOYMENT.md.
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'sync')
+threads = int(os.getenv('GUNICORN_THREADS', '1'))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '1000'))
 timeout = 120  # Increased timeout for production
 keepalive = 2
 
@@ -42,4 +47,13 @@ def on_reload(server):
     pass
 
 def on_exit(server):
-    pass 
\ No newline at end of file
+    pass
+
+def post_fork(server, worker):
+    # Make psycopg2 yield to other greenlets instead of blocking the worker
+    if worker_class == 'gevent':
+        try:
+            from psycogreen.gevent import patch_psycopg
+            patch_psycopg()
+        except ImportError:
+            server.log.warning("psycogreen not installed; database calls will block gevent workers")
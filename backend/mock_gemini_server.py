@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+Mock Gemini Server
+Local stand-in for the Gemini REST API (generateContent,
+streamGenerateContent and cachedContents) for offline load and regression
+testing. Point the backend at it with:
+
+    GEMINI_API_KEY=mock GEMINI_API_BASE=http://127.0.0.1:8089/v1beta
+
+Examples:
+    python mock_gemini_server.py --latency lognormal:0.8,0.4
+    python mock_gemini_server.py --latency intent=normal:0.3,0.1 --latency respond=uniform:1,3
+    python mock_gemini_server.py --error-rate 0.02 --rate-limit-rate 0.05 --retry-after 2
+"""
+import argparse
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+TASKS = ('intent', 'parse', 'respond', 'suggest', 'turn', 'probe')
+
+# Markers from app/services/prompt_builder.py that identify each task
+TASK_MARKERS = [
+    ('turn', 'TASK: Handle this turn in one pass.'),
+    ('intent', 'TASK: Analyze this conversation'),
+    ('suggest', 'follow-up questions/suggestions'),
+    ('respond', 'TASK: Respond as Alex'),
+    ('parse', 'User query:')
+]
+
+CATEGORY_KEYWORDS = {
+    'audio': ['headphone', 'speaker', 'earbud', 'soundbar', 'airpods', 'headset'],
+    'computers': ['laptop', 'desktop', 'monitor', 'computer', 'macbook', 'pc'],
+    'smartphones': ['phone', 'iphone', 'android', 'smartphone', 'mobile'],
+    'gaming': ['console', 'controller', 'gaming', 'ps5', 'xbox', 'nintendo'],
+    'accessories': ['charger', 'cable', 'power bank', 'keyboard', 'mouse', 'adapter']
+}
+GREETING_WORDS = {'hi', 'hello', 'hey', 'howdy', 'greetings'}
+
+CANNED_SUGGESTIONS = [
+    "Tell me more about the first product",
+    "Which has the best battery life?",
+    "Show me budget alternatives under $200",
+    "Any wireless options available?",
+    "What's the difference between these models?",
+    "Which would you recommend for a student?"
+]
+
+
+class LatencyModel:
+    """Samples response delays from a distribution spec.
+
+    Specs: ``fixed:S``, ``uniform:LOW,HIGH``, ``normal:MEAN,STDDEV`` and
+    ``lognormal:MEDIAN,SIGMA``, all in seconds.
+    """
+
+    def __init__(self, spec: str):
+        self.spec = spec
+        kind, _, params = spec.partition(':')
+        self.kind = kind
+        self.params = [float(value) for value in params.split(',') if value]
+        expected = {'fixed': 1, 'uniform': 2, 'normal': 2, 'lognormal': 2}
+        if kind not in expected or len(self.params) != expected[kind]:
+            raise ValueError(f"Invalid latency spec: {spec}")
+
+    def sample(self) -> float:
+        if self.kind == 'fixed':
+            delay = self.params[0]
+        elif self.kind == 'uniform':
+            delay = random.uniform(*self.params)
+        elif self.kind == 'normal':
+            delay = random.gauss(*self.params)
+        else:
+            median, sigma = self.params
+            delay = median * math.exp(random.gauss(0, sigma))
+        return max(0.0, delay)
+
+
+def _extract(pattern: str, prompt: str) -> str:
+    match = re.search(pattern, prompt)
+    return match.group(1).strip() if match else ''
+
+
+def _detect_task(prompt: str) -> str:
+    if prompt.strip() == 'ping':
+        return 'probe'
+    for task, marker in TASK_MARKERS:
+        if marker in prompt:
+            return task
+    return 'respond'
+
+
+def _filters_for(message: str) -> dict:
+    message = message.lower()
+    filters = {}
+    for category, keywords in CATEGORY_KEYWORDS.items():
+        if any(keyword in message for keyword in keywords):
+            filters['category'] = category
+            break
+    price = re.search(r'(?:under|below)\s*\$?(\d+)', message)
+    if price:
+        filters['price_range'] = {'min': None, 'max': int(price.group(1))}
+    return filters
+
+
+def _intent_for(message: str) -> dict:
+    words = set(re.findall(r"[a-z']+", message.lower()))
+    if words and words <= GREETING_WORDS | {'there', 'alex'}:
+        intent, response_type, needs_products = 'greeting', 'greeting', False
+    elif _filters_for(message):
+        intent, response_type, needs_products = 'product_search', 'product_recommendation', True
+    else:
+        intent, response_type, needs_products = 'question', 'general_help', False
+    return {
+        'intent': intent,
+        'urgency': 'medium',
+        'sentiment': 'neutral',
+        'needs_products': needs_products,
+        'follow_up_needed': True,
+        'response_type': response_type
+    }
+
+
+def _reply_for(query: str) -> str:
+    return (f"Great question about \"{query}\"! Based on what we have in stock, I'd start with the "
+            "top-rated option above: it balances performance, build quality and price really well. "
+            "If you tell me a bit more about how you'll use it, I can narrow it down further.")
+
+
+def canned_response(task: str, prompt: str) -> str:
+    if task == 'probe':
+        return 'pong'
+    if task == 'intent':
+        return json.dumps(_intent_for(_extract(r'CURRENT MESSAGE: "(.*)"', prompt)))
+    if task == 'parse':
+        return json.dumps(_filters_for(_extract(r'User query: (.*)', prompt)))
+    if task == 'suggest':
+        return '\n'.join(CANNED_SUGGESTIONS)
+    query = _extract(r'Customer Query: "(.*)"', prompt)
+    if task == 'turn':
+        result = _intent_for(query)
+        result.update({
+            'filters': _filters_for(query),
+            'reply': _reply_for(query),
+            'suggestions': CANNED_SUGGESTIONS
+        })
+        return json.dumps(result)
+    return _reply_for(query)
+
+
+def _candidate(text: str, finish: bool = True) -> dict:
+    candidate = {'content': {'parts': [{'text': text}], 'role': 'model'}}
+    if finish:
+        candidate['finishReason'] = 'STOP'
+    return {'candidates': [candidate]}
+
+
+class MockGemini:
+    def __init__(self, latency: dict, error_rate: float, rate_limit_rate: float,
+                 retry_after: float, chunk_size: int, chunk_delay: float):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.chunk_size = chunk_size
+        self.chunk_delay = chunk_delay
+        self._lock = threading.Lock()
+        self._counters = {}
+
+    def count(self, task: str, status: int):
+        with self._lock:
+            key = f"{task}:{status}"
+            self._counters[key] = self._counters.get(key, 0) + 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._counters)
+
+    def delay_for(self, task: str) -> float:
+        model = self.latency.get(task) or self.latency.get('default')
+        return model.sample() if model else 0.0
+
+    def injected_status(self) -> int:
+        roll = random.random()
+        if roll < self.rate_limit_rate:
+            return 429
+        if roll < self.rate_limit_rate + self.error_rate:
+            return 500
+        return 200
+
+
+def make_handler(mock: MockGemini):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status: int, payload: dict, headers: dict = None):
+            body = json.dumps(payload).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if urlparse(self.path).path == '/stats':
+                self._send_json(200, mock.stats())
+            else:
+                self._send_json(404, {'error': {'code': 404, 'message': 'Not found'}})
+
+        def do_POST(self):
+            path = urlparse(self.path).path
+            length = int(self.headers.get('Content-Length') or 0)
+            try:
+                request_body = json.loads(self.rfile.read(length) or b'{}')
+            except ValueError:
+                self._send_json(400, {'error': {'code': 400, 'message': 'Invalid JSON payload'}})
+                return
+
+            if path.endswith('/cachedContents'):
+                self._send_json(200, {'name': f"cachedContents/mock-{random.randrange(1 << 30):x}"})
+                return
+            if not (path.endswith(':generateContent') or path.endswith(':streamGenerateContent')):
+                self._send_json(404, {'error': {'code': 404, 'message': f'Unknown method {path}'}})
+                return
+
+            parts = [part.get('text', '') for content in request_body.get('contents', [])
+                     for part in content.get('parts', [])]
+            prompt = '\n'.join(parts)
+            task = _detect_task(prompt)
+
+            time.sleep(mock.delay_for(task))
+            status = 200 if task == 'probe' else mock.injected_status()
+            mock.count(task, status)
+            if status == 429:
+                self._send_json(429, {'error': {'code': 429, 'message': 'Resource has been exhausted', 'status': 'RESOURCE_EXHAUSTED'}},
+                                headers={'Retry-After': f"{mock.retry_after:g}"})
+                return
+            if status != 200:
+                self._send_json(status, {'error': {'code': status, 'message': 'Internal error', 'status': 'INTERNAL'}})
+                return
+
+            text = canned_response(task, prompt)
+            if path.endswith(':generateContent'):
+                self._send_json(200, _candidate(text))
+                return
+
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Connection', 'close')
+            self.end_headers()
+            self.close_connection = True
+            chunks = [text[i:i + mock.chunk_size] for i in range(0, len(text), mock.chunk_size)] or ['']
+            for i, chunk in enumerate(chunks):
+                event = _candidate(chunk, finish=i == len(chunks) - 1)
+                self.wfile.write(f"data: {json.dumps(event)}\r\n\r\n".encode('utf-8'))
+                self.wfile.flush()
+                if mock.chunk_delay:
+                    time.sleep(mock.chunk_delay)
+
+    return Handler
+
+
+def parse_latency(specs) -> dict:
+    latency = {}
+    for spec in specs or []:
+        task, _, distribution = spec.rpartition('=')
+        task = task or 'default'
+        if task not in TASKS and task != 'default':
+            raise ValueError(f"Unknown task in latency spec: {task}")
+        latency[task] = LatencyModel(distribution)
+    return latency
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for the Gemini REST API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency', action='append',
+                        help='[TASK=]DISTRIBUTION, e.g. lognormal:0.8,0.4 or respond=uniform:1,3 (repeatable)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of calls answered with 500')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='Share of calls answered with 429')
+    parser.add_argument('--retry-after', type=float, default=1.0, help='Retry-After seconds sent with 429s')
+    parser.add_argument('--chunk-size', type=int, default=40, help='Characters per streamed chunk')
+    parser.add_argument('--chunk-delay', type=float, default=0.02, help='Seconds between streamed chunks')
+    parser.add_argument('--seed', type=int, help='Random seed for reproducible runs')
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    try:
+        latency = parse_latency(args.latency)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return False
+
+    mock = MockGemini(latency, args.error_rate, args.rate_limit_rate,
+                      args.retry_after, args.chunk_size, args.chunk_delay)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(mock))
+    server.daemon_threads = True
+    print(f"🧪 Mock Gemini listening on http://{args.host}:{args.port}/v1beta")
+    print(f"   Latency: {', '.join(f'{task}={model.spec}' for task, model in latency.items()) or 'none'}")
+    print(f"   Errors: {args.error_rate:.1%} 500s, {args.rate_limit_rate:.1%} 429s")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)